@@ -0,0 +1,76 @@
+# Micro-benchmarks for ti_draw. Runs headless:
+#   python _bench_ti_draw.py
+import os
+os.environ.setdefault("TI_DRAW_BACKEND", "headless")
+
+import math
+import timeit
+
+import ti_draw as d
+import ti_plotlib as plt
+
+
+def _legacy_fill_arc(x, y, width, height, startAngle, arcAngle):
+    # fill_arc as it was before the trig tables / tessellation cache:
+    # math.cos / math.sin for every step of every call, new points list each time
+    x0, y0 = d._map_coords(x, y)
+    x1, y1 = d._map_coords(x + width, y + height)
+    width = x1 - x0
+    height = y1 - y0
+    start_rad = math.radians(startAngle)
+    end_rad = math.radians(startAngle + arcAngle)
+    steps = max(6, int(abs(arcAngle) / 5))
+    points = [(x + width / 2, y + height / 2)]
+    for i in range(steps + 1):
+        theta = start_rad + (end_rad - start_rad) * (i / steps)
+        px = x + width / 2 + (width / 2) * math.cos(theta)
+        py = y + height / 2 + (height / 2) * math.sin(theta)
+        points.append((px, py))
+    d.pygame.draw.polygon(d._surface, d._color_val(), points)
+
+
+def _pie(fill_arc):
+    # a 12-slice pie chart plus a row of round markers
+    for i in range(12):
+        fill_arc(100, 50, 120, 120, i * 30, 30)
+    for x in range(10, 310, 20):
+        fill_arc(x, 10, 8, 8, 0, 360)
+
+
+def bench_arcs(repeat=5, number=200):
+    d.clear()
+    legacy = min(timeit.repeat(lambda: _pie(_legacy_fill_arc), repeat=repeat, number=number))
+    cached = min(timeit.repeat(lambda: _pie(d.fill_arc), repeat=repeat, number=number))
+    calls = number * 27
+    print("fill_arc, %d calls" % calls)
+    print("  legacy tessellation: %8.2f us/call" % (legacy / calls * 1e6))
+    print("  cached tessellation: %8.2f us/call" % (cached / calls * 1e6))
+    print("  speedup:             %8.2fx" % (legacy / cached))
+
+
+def _legacy_plot(xs, ys):
+    # ti_plotlib.plot before the bulk path: one draw_line per segment and one
+    # fill_circle per mark, each mapping its coordinates on its own
+    for i in range(len(xs) - 1):
+        d.draw_line(xs[i], xs[i + 1], ys[i], ys[i + 1])
+    for x, y in zip(xs, ys):
+        d.fill_circle(x, y, 1)
+
+
+def bench_plot(points=20000):
+    import numpy as np
+    x = np.linspace(0, 10, points)
+    y = np.sin(x)
+    plt.window(0, 10, -1.5, 1.5)
+    xs, ys = x.tolist(), y.tolist()
+    legacy = min(timeit.repeat(lambda: _legacy_plot(xs, ys), repeat=3, number=1))
+    bulk = min(timeit.repeat(lambda: plt.plot(x, y, "."), repeat=3, number=1))
+    print("ti_plotlib.plot, %d points with marks" % points)
+    print("  per-point calls: %8.3f s" % legacy)
+    print("  bulk calls:      %8.3f s" % bulk)
+    print("  speedup:         %8.2fx" % (legacy / bulk))
+
+
+if __name__ == "__main__":
+    bench_arcs()
+    bench_plot()
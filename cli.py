@@ -93,8 +93,9 @@ class cli:
         lg.call("getInput", prompt)
         s.display(prompt)
         result = ""
+        wait_key = getattr(tis, "wait_key", None) # blocking read, PC only
         while True:
-            k = tis.get_key()
+            k = wait_key() if wait_key else tis.get_key()
             if k == "esc":
                 break
             if k == "enter":
@@ -146,7 +147,8 @@ class cli:
                 # Doesn't work
             # end of checking whether key pressed is empty or not
             result = s.text_history[-1][len(prompt):len(s.text_history[-1])]
-            t.sleep(0.01)
+            if not wait_key or k == "": # wait_key returns "" at once when stdin is at EOF
+                t.sleep(0.01)
         # end of while loop
         lg.end(result)
         return result
@@ -87,6 +87,8 @@ class file:
             tis.store_list(filename, s.buffer)
         return s.buffer
     def update_buffer(s):
+        if not getattr(s, "saved", True):
+            return # the store keeps a copy: reloading would drop unsaved lines
         s._load_content_to_buffer(s.filename)
         s.saved=True
     def _check_fn(s, fn: str | None = None):
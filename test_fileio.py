@@ -0,0 +1,29 @@
+import unittest
+
+import fileio
+import ti_system as tis
+
+
+class TestFile(unittest.TestCase):
+    def setUp(self):
+        tis._variable_store.clear()
+
+    def tearDown(self):
+        tis._variable_store.clear()
+
+    def test_unsaved_lines_survive_reading(self):
+        f = fileio.file("notes")
+        f.writeline("hello")
+        self.assertEqual(f.toStrList(), ["hello", ""])
+        f.save()
+        self.assertEqual(tis.recall_list("notes"), [104, 101, 108, 108, 111, 10])
+
+    def test_saved_file_reloads(self):
+        f = fileio.file("notes")
+        f.writeline("hi")
+        f.save()
+        self.assertEqual(fileio.file("notes").toStrList(), ["hi", ""])
+
+
+if __name__ == "__main__":
+    unittest.main()
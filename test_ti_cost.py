@@ -0,0 +1,101 @@
+# test_ti_cost.py
+import os
+import sys
+import unittest
+
+import ti_cost as tc
+import ti_draw as td
+import ti_system as tis
+
+
+def loop(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+class TestCostEstimator(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        tis._variable_store.clear()
+
+    def tearDown(self):
+        tc.stop()
+        td.reset_profile()
+        tis.reset_profile()
+        td.set_backend("pygame")
+
+    def test_bytecodes_scale_with_work(self):
+        _, small = tc.measure(loop, 100)
+        _, large = tc.measure(loop, 1000)
+        self.assertGreater(small["counts"]["bytecodes"], 100)
+        self.assertGreater(large["counts"]["bytecodes"], 8 * small["counts"]["bytecodes"])
+        self.assertGreater(large["estimate"]["python"], small["estimate"]["python"])
+
+    def test_counted_paths(self):
+        _, mine = tc.measure(loop, 100, paths=[__file__])
+        self.assertGreater(mine["counts"]["bytecodes"], 100)
+        _, other = tc.measure(loop, 100, paths=[os.path.join(os.path.dirname(__file__), "nowhere")])
+        self.assertEqual(other["counts"]["bytecodes"], 0)
+
+    def test_keeps_existing_tracer(self):
+        previous = sys.gettrace()
+        tracer = lambda frame, event, arg: None
+        sys.settrace(tracer)
+        try:
+            tc.measure(loop, 10)
+            self.assertIs(sys.gettrace(), tracer)
+            tc.stop()  # when not running it leaves the tracer alone
+            self.assertIs(sys.gettrace(), tracer)
+        finally:
+            sys.settrace(previous)
+
+    def test_draw_and_store_counts(self):
+        def program():
+            td.set_color(255, 0, 0)
+            td.fill_rect(0, 0, 10, 10)
+            td.plot_xy_many([1, 2, 3], [1, 2, 3])
+            td.stamp_many([1, 2], [1, 2], [-1, 1, 0, 0], [0, 0, -1, 1], 2)
+            td.draw_text(10, 10, "hi")
+            tis.store_list("a", [1, 2])
+            tis.recall_list("a")
+            td.clear()
+        _, report = tc.measure(program)
+        counts = report["counts"]
+        self.assertEqual(counts["draw_calls"]["fill_rect"], (1, 1))
+        self.assertEqual(counts["draw_calls"]["plot_xy_many"], (1, 3))
+        self.assertEqual(counts["draw_calls"]["stamp_many"], (1, 4))  # two crosses
+        self.assertEqual(counts["system_calls"], {"store_list": 1, "recall_list": 1})
+        self.assertEqual(counts["presents"], 1)
+        self.assertGreater(counts["draw_pixels"], 100)
+        est = report["estimate"]
+        costs = tc.get_costs()
+        self.assertGreaterEqual(est["draw"], 3 * costs["draw_call"] + costs["draw:draw_text"])
+        self.assertAlmostEqual(est["system"], costs["system:store_list"] + costs["system_call"])
+        self.assertAlmostEqual(est["total"], est["python"] + est["draw"] + est["present"] + est["system"])
+
+    def test_marks_per_frame(self):
+        tc.start()
+        for n in (1, 5):
+            for _ in range(n):
+                td.fill_circle(50, 50, 3)
+            tc.mark()
+        report = tc.stop()
+        (_, first), (_, second) = report["marks"]
+        self.assertGreater(second, first)
+        self.assertEqual(report["mark_max"], second)
+
+    def test_set_costs(self):
+        old = tc.get_costs()
+        try:
+            tc.set_costs(bytecode=0.0)
+            _, report = tc.measure(loop, 100)
+            self.assertEqual(report["estimate"]["python"], 0.0)
+        finally:
+            tc.set_costs(**old)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 # test_ti_draw_basic.py
+import io
+import threading
 import unittest
+from array import array
 import ti_draw as td
 
 import pygame
@@ -57,5 +60,695 @@ class TestTIDraw(unittest.TestCase):
         td.clear_rect(10, 10, 50, 50)  # Can't verify visually, but should not crash
 
 
+class TestHeadlessBackend(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.clear()
+        td.set_color(0, 0, 0)
+
+    def tearDown(self):
+        td.set_backend("pygame")
+
+    def test_frame_bytes_size(self):
+        frame = td.get_frame_bytes()
+        self.assertEqual(len(frame), 318 * 212 * 3)
+        self.assertEqual(frame[:3], bytes((255, 255, 255)))
+
+    def test_frame_array_reflects_drawing(self):
+        td.set_color(255, 0, 0)
+        td.fill_circle(50, 162, 10)  # pixel (50, 50)
+        frame = td.get_frame_array()
+        self.assertEqual(frame.shape, (212, 318, 3))
+        self.assertEqual(tuple(frame[50, 50]), (255, 0, 0))
+        self.assertEqual(tuple(frame[150, 100]), (255, 255, 255))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            td.set_backend("vulkan")
+
+
+class TestDirtyRects(unittest.TestCase):
+
+    def setUp(self):
+        td.set_window(0, 318, 0, 212)
+        td.clear()
+        td.reset_present_stats()
+
+    def test_clear_pushes_whole_screen(self):
+        td.clear()
+        stats = td.get_present_stats()
+        self.assertEqual(stats["last_pixels"], 318 * 212)
+        self.assertEqual(stats["last_rects"], 1)
+
+    def test_small_change_pushes_small_area(self):
+        td.use_buffer()
+        td.draw_text(0, 200, "a")
+        td.paint_buffer()
+        stats = td.get_present_stats()
+        self.assertGreater(stats["last_pixels"], 0)
+        self.assertLess(stats["last_pixels"], 318 * 212 // 10)
+
+    def test_overlapping_rects_are_merged(self):
+        td.fill_circle(50, 100, 10)
+        td.fill_circle(55, 100, 10)
+        td.fill_circle(250, 100, 5)
+        self.assertEqual(len(td._dirty_rects), 2)
+
+    def test_present_without_changes_is_skipped(self):
+        td.paint_buffer()
+        stats = td.get_present_stats()
+        self.assertEqual(stats["frames"], 0)
+        self.assertEqual(stats["skipped"], 1)
+
+
+class TestDisplayList(unittest.TestCase):
+
+    def setUp(self):
+        td.set_window(0, 318, 0, 212)
+        td.clear()
+        td.set_color(0, 0, 0)
+        td.set_pen("thin", "solid")
+
+    def tearDown(self):
+        td._buffer_actions.clear()
+        td.paint_buffer()
+
+    def test_connected_lines_collapse_to_polyline(self):
+        td.use_buffer()
+        td.draw_line(0, 10, 0, 10)
+        td.draw_line(10, 20, 10, 0)
+        td.draw_line(20, 30, 0, 10)
+        dl = td.compile_buffer()
+        self.assertEqual(len(dl), 1)
+        self.assertEqual(dl.ops[0][0], "lines")
+        self.assertEqual(len(dl.ops[0][4]), 4)
+
+    def test_fill_rects_batched_per_color(self):
+        td.use_buffer()
+        td.fill_rect(0, 0, 5, 5)
+        td.fill_rect(10, 0, 5, 5)
+        td.set_color(255, 0, 0)
+        td.fill_rect(20, 0, 5, 5)
+        dl = td.compile_buffer()
+        self.assertEqual([op[0] for op in dl.ops], ["fills", "rect"])
+
+    def test_state_captured_when_queued(self):
+        td.use_buffer()
+        td.set_color(255, 0, 0)
+        td.fill_rect(0, 0, 20, 20)
+        td.set_color(0, 0, 255)
+        td.paint_buffer()
+        self.assertEqual(tuple(td._surface.get_at((5, 205)))[:3], (255, 0, 0))
+
+    def test_replay_many_times(self):
+        td.use_buffer()
+        td.fill_rect(0, 0, 20, 20)
+        dl = td.compile_buffer()
+        td.paint_buffer()
+        for _ in range(3):
+            td.clear()
+            dl.replay()
+            self.assertEqual(tuple(td._surface.get_at((5, 205)))[:3], (0, 0, 0))
+
+
+class TestTextCache(unittest.TestCase):
+
+    def setUp(self):
+        td.clear_text_cache()
+        td.set_text_cache_size(256, max_len=64)
+
+    def tearDown(self):
+        td.set_text_cache_size(256, max_len=64)
+
+    def test_repeated_text_hits_cache(self):
+        for _ in range(5):
+            td.draw_text(0, 100, "ls -l")
+        stats = td.get_text_cache_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 4)
+
+    def test_color_is_part_of_key(self):
+        td.draw_text(0, 100, "x")
+        td.set_color(255, 0, 0)
+        td.draw_text(0, 100, "x")
+        self.assertEqual(td.get_text_cache_stats()["misses"], 2)
+
+    def test_lru_eviction(self):
+        td.set_text_cache_size(2)
+        for text in ("a", "b", "c", "a"):
+            td.draw_text(0, 100, text)
+        stats = td.get_text_cache_stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["evictions"], 2)
+        self.assertEqual(stats["hits"], 0)
+
+    def test_long_text_uses_glyph_atlas(self):
+        td.set_text_cache_size(256, max_len=4)
+        td.draw_text(0, 100, "abcabc")
+        stats = td.get_text_cache_stats()
+        self.assertEqual(stats["size"], 0)
+        self.assertEqual(stats["glyph_misses"], 3)
+        self.assertEqual(stats["glyph_hits"], 3)
+
+
+class TestBulkDrawing(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(-10, 10, -10, 10)
+        td.set_color(0, 0, 0)
+        td.set_pen("thin", "solid")
+        td.clear()
+
+    def tearDown(self):
+        td.set_window(0, 318, 0, 212)
+        td.set_backend("pygame")
+
+    def _frame_of(self, draw):
+        td.clear()
+        draw()
+        return td.get_frame_bytes()
+
+    def test_plot_xy_many_matches_scalar(self):
+        xs = [i / 3 for i in range(-30, 30)]
+        ys = [x * x / 10 - 5 for x in xs]
+        def scalar():
+            for x, y in zip(xs, ys):
+                td.plot_xy(x, y)
+        self.assertEqual(self._frame_of(scalar), self._frame_of(lambda: td.plot_xy_many(xs, ys)))
+
+    def test_draw_lines_many_matches_scalar(self):
+        x1s, x2s, y1s, y2s = [-5, 0, 3], [5, 2, 3], [-5, 4, -9], [5, -4, 9]
+        def scalar():
+            for args in zip(x1s, x2s, y1s, y2s):
+                td.draw_line(*args)
+        bulk = lambda: td.draw_lines_many(x1s, x2s, y1s, y2s)
+        self.assertEqual(self._frame_of(scalar), self._frame_of(bulk))
+
+    def test_fill_rects_many_matches_scalar(self):
+        xs, ys, ws, hs = [-9, 0], [-9, 2], [3, 4], [2, 5]
+        def scalar():
+            for args in zip(xs, ys, ws, hs):
+                td.fill_rect(*args)
+        bulk = lambda: td.fill_rects_many(xs, ys, ws, hs)
+        self.assertEqual(self._frame_of(scalar), self._frame_of(bulk))
+
+    def test_edge_crossing_items_match_scalar(self):
+        # inside, crossing each edge, far outside, non-finite
+        x1s, x2s = [-5, -14, 8, 0, 30, float("nan")], [5, 0, 14, 1, 40, 1]
+        y1s, y2s = [-5, 2, -3, 9, 30, 0], [5, 3, 4, 15, 40, 1]
+        def scalar():
+            for args in zip(x1s, x2s, y1s, y2s):
+                td.draw_line(*args)
+            for args in zip(x1s, y1s, [3] * 6, [-4] * 6):
+                td.fill_rect(*args)
+        def bulk():
+            td.draw_lines_many(x1s, x2s, y1s, y2s)
+            td.fill_rects_many(x1s, y1s, [3] * 6, [-4] * 6)
+        self.assertEqual(self._frame_of(scalar), self._frame_of(bulk))
+
+    def test_clipped_polyline_matches_scalar(self):
+        # dense points (many per pixel) that leave the window again and again
+        xs = [i / 200 - 15 for i in range(6000)]
+        ys = [60 * abs((x / 6) % 2 - 1) - 30 for x in xs]
+        def scalar():
+            for i in range(len(xs) - 1):
+                td.draw_line(xs[i], xs[i + 1], ys[i], ys[i + 1])
+        bulk = lambda: td.draw_polyline(xs, ys)
+        self.assertEqual(self._frame_of(scalar), self._frame_of(bulk))
+        td.use_buffer()
+        td.draw_polyline(xs, ys)
+        op = td._buffer_actions[0]
+        td.paint_buffer()
+        self.assertEqual(op[0], "runs")
+        self.assertLess(sum(len(run) for run in op[4]), len(xs) // 3)  # repeats dropped
+
+    def test_accepts_array_module_buffers(self):
+        xs = array("d", [-1.0, 0.0, 1.0])
+        ys = array("d", [1.0, 0.0, -1.0])
+        td.draw_polyline(xs, ys)
+        td.plot_xy_many(xs, ys)
+
+    def test_bulk_call_is_one_buffered_op(self):
+        td.use_buffer()
+        td.plot_xy_many(list(range(-9, 9)), [0] * 18)
+        self.assertEqual(len(td._buffer_actions), 1)
+        td.paint_buffer()
+
+
+class TestPenStyles(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.set_color(0, 0, 0)
+        td.clear()
+
+    def tearDown(self):
+        td.set_pen("thin", "solid")
+        td.set_backend("pygame")
+
+    def _row(self, y):
+        return [td._surface.get_at((x, y))[0] == 0 for x in range(318)]
+
+    def test_solid_line_is_continuous(self):
+        td.set_pen("thin", "solid")
+        td.draw_line(10, 110, 112, 112)
+        self.assertTrue(all(self._row(100)[10:110]))
+
+    def test_dashed_line_has_gaps(self):
+        td.set_pen("thin", "dashed")
+        td.draw_line(10, 110, 112, 112)
+        row = self._row(100)
+        self.assertTrue(all(row[10:18]))
+        self.assertFalse(any(row[20:23]))
+        self.assertTrue(all(row[24:32]))
+
+    def test_dotted_line_spacing(self):
+        td.set_pen("thin", "dotted")
+        td.draw_line(10, 110, 112, 112)
+        row = self._row(100)
+        self.assertTrue(row[10] and row[15] and row[20])
+        self.assertFalse(row[12] or row[17])
+
+    def test_dashed_rect_outline(self):
+        td.set_pen("thin", "dashed")
+        td.draw_rect(10, 10, 100, 100)
+        row = self._row(102)
+        self.assertTrue(any(row[10:110]))
+        self.assertFalse(all(row[10:110]))
+
+    def test_buffered_styled_lines_match_immediate(self):
+        def zigzag():
+            for i in range(6):
+                td.draw_line(10 + 13 * i, 23 + 13 * i, 50 + 7 * (i % 2), 57 - 7 * (i % 2))
+        for style in ("dashed", "dotted"):
+            td.set_pen("medium", style)
+            td.clear()
+            zigzag()
+            immediate = td.get_frame_bytes()
+            td.clear()
+            td.use_buffer()
+            zigzag()
+            td.paint_buffer()
+            self.assertEqual(td.get_frame_bytes(), immediate, style)
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.set_pen("thin", "solid")
+        td.set_color(0, 0, 0)
+
+    def tearDown(self):
+        td.stop_recording()
+        td.set_window(0, 318, 0, 212)
+        td.set_backend("pygame")
+
+    def _session(self):
+        td.clear()
+        td.set_window(-10, 10, -10, 10)
+        td.set_color(200, 0, 0)
+        td.set_pen("medium", "dashed")
+        td.use_buffer()
+        td.draw_line(-9, 9, -9, 9)
+        td.fill_rect(-5, -5, 3, 4)
+        td.draw_text(0, 0, "hello")
+        td.fill_poly([0, 5, 5], [0, 0, 5])
+        td.plot_xy_many([1, 2, 3], [3, 2, 1])
+        td.paint_buffer()
+
+    def test_replay_reproduces_frame(self):
+        stream = io.BytesIO()
+        td.start_recording(stream)
+        self._session()
+        td.stop_recording()
+        expected = td.get_frame_bytes()
+
+        td.set_window(0, 318, 0, 212)
+        td.set_color(0, 0, 0)
+        td.clear()
+        frames = []
+        count = td.replay(stream.getvalue(), on_present=lambda: frames.append(td.get_frame_bytes()))
+        self.assertEqual(count, 11)
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(frames[-1], expected)
+
+    def test_replay_reproduces_display_list_frames(self):
+        def session(frames):
+            td.clear()
+            td.use_buffer()
+            td.fill_rect(10, 10, 50, 30)
+            td.draw_line(0, 318, 0, 212)
+            grid = td.compile_buffer()
+            td.paint_buffer()  # leave buffer mode
+            for i in range(3):
+                grid.replay()
+                td.fill_circle(80 + 40 * i, 100, 10)
+                td.end_frame()
+                frames.append(td.get_frame_bytes())
+
+        stream = io.BytesIO()
+        td.start_recording(stream)
+        expected = []
+        session(expected)
+        td.stop_recording()
+
+        td.clear()
+        frames = []
+        td.replay(stream.getvalue(), on_present=lambda: frames.append(td.get_frame_bytes()))
+        self.assertEqual(frames[2:], expected)
+
+    def test_records_are_compact(self):
+        stream = io.BytesIO()
+        td.start_recording(stream)
+        td.draw_line(0, 1, 2, 3)
+        td.stop_recording()
+        self.assertEqual(len(stream.getvalue()), len(td._rec_magic) + 1 + 4 * 8)
+
+    def test_rejects_foreign_data(self):
+        with self.assertRaises(ValueError):
+            td.replay(b"not a recording")
+
+
+class TestFramePacing(unittest.TestCase):
+
+    def setUp(self):
+        # drive the scheduler with a fake clock: sleeping advances it
+        self.now = 0.0
+        self.slept = []
+        def sleep(seconds):
+            self.slept.append(seconds)
+            self.now += seconds
+        self._old = (td._frame_clock, td._frame_sleep)
+        td._frame_clock = lambda: self.now
+        td._frame_sleep = sleep
+        td.set_backend("headless")
+        td.reset_frame_stats()
+        td.set_target_fps(50)  # 20ms budget
+
+    def tearDown(self):
+        td._frame_clock, td._frame_sleep = self._old
+        td.set_target_fps(0)
+        td.reset_frame_stats()
+        td.set_backend("pygame")
+
+    def test_sleeps_only_remaining_time(self):
+        td.end_frame()           # first frame starts the clock
+        self.now += 0.005        # 5ms of work
+        td.end_frame()
+        self.assertAlmostEqual(self.slept[-1], 0.015)
+
+    def test_slow_frames_are_dropped(self):
+        td.end_frame()
+        self.now += 0.030
+        td.end_frame()
+        stats = td.get_frame_stats()
+        self.assertEqual(stats["dropped"], 1)
+        self.assertAlmostEqual(stats["max_ms"], 30.0)
+
+    def test_idle_frames_skip_present(self):
+        td.fill_circle(10, 10, 3)
+        td.end_frame()
+        td.end_frame()
+        stats = td.get_frame_stats()
+        self.assertEqual(stats["presented"], 1)
+        self.assertEqual(stats["idle"], 1)
+
+    def test_virtual_system_clock(self):
+        import ti_system as tis
+        tis.set_clock("virtual")
+        td.set_frame_clock(tis.clock_seconds, tis.sleep)
+        try:
+            start = tis.get_time_ms()
+            for _ in range(5):
+                td.end_frame()
+            self.assertEqual(tis.get_time_ms() - start, 100)  # 5 idle frames of 20ms
+        finally:
+            td.set_frame_clock()
+            tis.set_clock("real")
+
+    def test_percentiles(self):
+        td.end_frame()
+        for ms in range(1, 101):
+            self.now += ms / 1000
+            td.end_frame()
+        stats = td.get_frame_stats()
+        self.assertAlmostEqual(stats["p50_ms"], 50, delta=1)
+        self.assertAlmostEqual(stats["p95_ms"], 95, delta=1)
+
+
+class TestClipping(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.set_color(0, 0, 0)
+        td.set_pen("thin", "solid")
+        td.clear()
+        td.reset_cull_stats()
+
+    def tearDown(self):
+        td.set_backend("pygame")
+
+    def test_offscreen_primitives_are_culled(self):
+        td.draw_line(1000, 2000, 1000, 2000)
+        td.fill_rect(-500, -500, 10, 10)
+        td.fill_circle(5000, 100, 3)
+        td.fill_poly([900, 950, 950], [0, 0, 50])
+        td.draw_text(400, 100, "off")
+        self.assertEqual(td.get_cull_stats()["culled"], 5)
+        self.assertEqual(td.get_frame_bytes(), bytes([255]) * (318 * 212 * 3))
+
+    def test_clipped_line_matches_visible_part(self):
+        td.draw_line(-1e6, 1e6 + 318, 106, 106)
+        self.assertEqual(td.get_cull_stats()["clipped"], 1)
+        self.assertEqual(td._surface.get_at((0, 106))[:3], (0, 0, 0))
+        self.assertEqual(td._surface.get_at((317, 106))[:3], (0, 0, 0))
+
+    def test_huge_and_nonfinite_coordinates_do_not_raise(self):
+        td.draw_line(-1e300, 1e300, -1e300, 1e300)
+        td.fill_rect(-1e300, -1e300, 2e300, 2e300)
+        td.fill_poly([-1e200, 1e200, 0], [-1e200, -1e200, 1e200])
+        td.draw_line(float("nan"), 0, 0, 10)
+        self.assertEqual(td.get_cull_stats()["culled"], 1)
+        self.assertEqual(td._surface.get_at((100, 100))[:3], (0, 0, 0))
+
+    def test_bulk_points_culled_individually(self):
+        td.plot_xy_many([10, 20, 1000, -1000], [10, 20, 10, 10])
+        self.assertEqual(td.get_cull_stats()["culled"], 2)
+
+
+class TestLayers(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.set_pen("thin", "solid")
+        td.begin_layer("background")
+        td.set_color(0, 0, 255)
+        td.fill_rect(0, 0, 318, 212)
+        td.begin_layer("data")
+        td.set_color(255, 0, 0)
+        td.fill_rect(10, 10, 20, 20)
+        td.end_layer()
+
+    def tearDown(self):
+        td.end_layer()
+        for name in td.get_layer_names():
+            td.remove_layer(name)
+        td.set_color(0, 0, 0)
+        td.set_backend("pygame")
+
+    def pixel(self, x, y):
+        return tuple(td._surface.get_at((x, y)))[:3]
+
+    def test_draw_calls_go_to_layer_not_screen(self):
+        td.clear()
+        self.assertEqual(self.pixel(15, 190), (255, 255, 255))
+        td.composite_layers()
+        self.assertEqual(self.pixel(15, 190), (255, 0, 0))
+        self.assertEqual(self.pixel(100, 100), (0, 0, 255))
+
+    def test_only_invalidated_layers_rerender(self):
+        td.composite_layers()
+        td.begin_layer("data")
+        td.set_color(255, 0, 0)
+        td.fill_rect(50, 50, 20, 20)
+        td.end_layer()
+        td.composite_layers()
+        self.assertEqual(td._layers["background"].renders, 1)
+        self.assertEqual(td._layers["data"].renders, 2)
+        self.assertEqual(self.pixel(15, 190), (0, 0, 255))  # old data gone
+        self.assertEqual(self.pixel(55, 155), (255, 0, 0))
+
+    def test_unchanged_composite_pushes_nothing(self):
+        td.composite_layers()
+        td.reset_present_stats()
+        td.composite_layers()
+        self.assertEqual(td.get_present_stats()["frames"], 0)
+
+    def test_hidden_layer(self):
+        td.set_layer_visible("data", False)
+        td.composite_layers()
+        self.assertEqual(self.pixel(15, 190), (0, 0, 255))
+
+
+class TestArcs(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.set_color(0, 0, 0)
+        td.set_pen("thin", "solid")
+        td.clear()
+
+    def tearDown(self):
+        td.set_backend("pygame")
+
+    def pixel(self, x, y):
+        return tuple(td._surface.get_at((x, y)))[:3]
+
+    def test_arc_uses_mapped_rect(self):
+        td.fill_arc(100, 50, 40, 40, 0, 360)  # pixel rect x 100..140, y 122..162
+        self.assertEqual(self.pixel(120, 142), (0, 0, 0))
+        self.assertEqual(self.pixel(120, 70), (255, 255, 255))
+
+    def test_pie_slice_quadrant(self):
+        td.fill_arc(100, 50, 40, 40, 0, 90)  # upper-right quarter on screen
+        self.assertEqual(self.pixel(130, 132), (0, 0, 0))
+        self.assertEqual(self.pixel(110, 152), (255, 255, 255))
+
+    def test_repeated_arcs_hit_tessellation_cache(self):
+        td._arc_cache.clear()
+        before = dict(td._arc_cache_stats)
+        for x in range(0, 300, 30):
+            td.fill_arc(x, 50, 20, 20, 30, 120)
+        self.assertEqual(td._arc_cache_stats["misses"] - before["misses"], 1)
+        self.assertEqual(td._arc_cache_stats["hits"] - before["hits"], 9)
+
+
+class TestRenderThread(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.set_color(0, 0, 0)
+        td.set_pen("thin", "solid")
+        td.clear()
+        td.start_render_thread()
+
+    def tearDown(self):
+        td.stop_render_thread()
+        td.set_backend("pygame")
+
+    def test_commands_run_on_render_thread(self):
+        td.fill_rect(0, 0, 50, 50)
+        td.sync()
+        self.assertEqual(tuple(td._surface.get_at((10, 200)))[:3], (0, 0, 0))
+
+    def test_draw_calls_only_queue(self):
+        td.fill_rect(0, 0, 50, 50)
+        self.assertEqual(len(td._render_pending), 1)
+        td.flush()
+        self.assertEqual(len(td._render_pending), 0)
+        td.sync()
+
+    def test_frame_read_syncs(self):
+        td.clear()
+        td.set_color(255, 0, 0)
+        td.fill_circle(100, 100, 5)
+        frame = td.get_frame_array()
+        self.assertEqual(tuple(frame[112, 100]), (255, 0, 0))
+
+    def test_presents_on_calling_thread(self):
+        threads = []
+        present_rects = td._present_rects
+        def spy():
+            threads.append(threading.current_thread())
+            return present_rects()
+        td._present_rects = spy
+        self.addCleanup(setattr, td, "_present_rects", present_rects)
+        td.fill_rect(0, 0, 50, 50)
+        td.clear()
+        self.assertEqual(threads, [])  # deferred until the frame is drawn
+        td.end_frame()
+        self.assertEqual(threads, [threading.main_thread()])
+
+    def test_frame_stats_count_presents(self):
+        td.end_frame()  # the clear() from setUp
+        td.reset_frame_stats()
+        td.fill_circle(10, 10, 3)
+        td.end_frame()
+        td.end_frame()
+        stats = td.get_frame_stats()
+        self.assertEqual(stats["presented"], 1)
+        self.assertEqual(stats["idle"], 1)
+
+    def test_errors_surface_on_sync(self):
+        td._submit(lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            td.sync()
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        td.set_window(0, 318, 0, 212)
+        td.set_pen("thin", "solid")
+        td.reset_profile()
+        td.start_profiling()
+
+    def tearDown(self):
+        td.stop_profiling()
+        td.reset_profile()
+        td.set_backend("pygame")
+
+    def test_counts_per_primitive(self):
+        td.fill_rect(10, 10, 20, 20)
+        td.fill_rect(40, 10, 20, 20)
+        td.draw_rect(10, 50, 20, 20)
+        td.draw_text(10, 100, "hi")
+        profile = td.get_profile()
+        self.assertEqual(profile["fill_rect"]["calls"], 2)
+        self.assertEqual(profile["fill_rect"]["pixels"], 800)
+        self.assertEqual(profile["draw_rect"]["calls"], 1)
+        self.assertEqual(profile["draw_text"]["calls"], 1)
+        self.assertGreaterEqual(profile["fill_rect"]["seconds"], 0.0)
+
+    def test_pixels_follow_the_shape(self):
+        td.draw_line(0, 317, 0, 211)  # diagonal: one pixel per column, not the whole box
+        td.plot_xy_many([10, 300], [10, 200], 7)  # two marks, far apart
+        profile = td.get_profile()
+        self.assertEqual(profile["draw_line"]["pixels"], 318)
+        self.assertLess(profile["plot_xy"]["pixels"], 100)
+
+    def test_paint_buffer_and_present(self):
+        td.use_buffer()
+        td.fill_circle(50, 50, 5)
+        td.paint_buffer()
+        profile = td.get_profile()
+        self.assertEqual(profile["paint_buffer"]["calls"], 1)
+        self.assertEqual(profile["present"]["calls"], 1)
+        self.assertEqual(profile["fill_circle"]["calls"], 1)
+
+    def test_off_collects_nothing_and_keeps_report(self):
+        td.fill_circle(50, 50, 5)
+        td.stop_profiling()
+        td.fill_circle(50, 50, 5)
+        self.assertEqual(td.get_profile()["fill_circle"]["calls"], 1)
+
+    def test_csv(self):
+        td.draw_line(0, 10, 0, 10)
+        lines = td.get_profile_csv().splitlines()
+        self.assertEqual(lines[0], "name,calls,seconds,pixels")
+        self.assertTrue(lines[1].startswith("draw_line,1,"))
+
+
 if __name__ == "__main__":
     unittest.main()
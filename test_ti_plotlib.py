@@ -0,0 +1,78 @@
+# test_ti_plotlib.py
+import io
+import unittest
+from array import array
+
+import numpy as np
+
+import ti_draw as td
+import ti_plotlib as plt
+
+
+class TestBulkPlotting(unittest.TestCase):
+
+    def setUp(self):
+        td.set_backend("headless")
+        plt.cls()
+        plt.window(-1, 11, -2, 2)
+        plt.pen("thin", "solid")
+        plt.color(0, 0, 0)
+
+    def tearDown(self):
+        if td._recorder is not None:
+            td.stop_recording()
+        td.set_backend("pygame")
+
+    def first_call(self, func, *args):
+        """Name of the first ti_draw call func(*args) makes."""
+        stream = io.BytesIO()
+        td.start_recording(stream)
+        func(*args)
+        td.stop_recording()
+        return td._rec_ops[stream.getvalue()[len(td._rec_magic)] - 1][0]
+
+    def test_sequence_types(self):
+        xs = [0, 2.5, 5, 7.5, 10]
+        ys = [0, 1, 0, -1, 0]
+        frames = []
+        for conv in (list, tuple, lambda v: array("d", v), np.array):
+            plt.cls()
+            plt.plot(conv(xs), conv(ys), "o")
+            frames.append(td.get_frame_array().copy())
+        for frame in frames[1:]:
+            self.assertTrue((frame == frames[0]).all())
+        self.assertTrue((frames[0] == 0).any())
+
+    def test_one_bulk_call_per_plot(self):
+        x = np.linspace(0, 10, 10000)
+        self.assertEqual(self.first_call(plt.plot, x, np.sin(x), ""), "draw_polyline")
+        self.assertEqual(self.first_call(plt.scatter, x, np.cos(x), "o"), "fill_circles_many")
+
+    def test_marks_match_single_point_drawing(self):
+        xs = np.array([1.0, 4.0, 8.0])
+        ys = np.array([-1.0, 0.5, 1.5])
+        for mark in (".", "o", "+", "x"):
+            plt.cls()
+            plt.scatter(xs, ys, mark)
+            bulk = td.get_frame_array().copy()
+            plt.cls()
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                plt._draw_mark(x, y, mark)
+            self.assertTrue((td.get_frame_array() == bulk).all(), mark)
+
+    def test_thin_crosses_are_stamped(self):
+        x = np.linspace(0, 10, 50)
+        self.assertEqual(self.first_call(plt.scatter, x, np.cos(x), "+"), "stamp_many")
+        plt.pen("medium", "solid")
+        self.assertEqual(self.first_call(plt.scatter, x, np.cos(x), "x"), "draw_lines_many")
+
+    def test_auto_window_numpy(self):
+        x = np.linspace(-3, 7, 100)
+        plt.auto_window(x, x * 2)
+        self.assertLess(plt.xmin, -3)
+        self.assertGreater(plt.ymax, 14)
+        self.assertIsInstance(plt.xmin, float)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,10 @@ import unittest
 import time
 import types
 import builtins
+import os
+import subprocess
+import sys
+import tempfile
 
 import ti_system as tis
 
@@ -11,6 +15,10 @@ class TestTiSystem(unittest.TestCase):
         # Reset state before each test
         tis._variable_store.clear()
         tis._last_key = None
+        tis.clear_events()
+        tis.reset_event_stats()
+        event = tis.pygame.event
+        self.addCleanup(setattr, event, "get", event.get)
 
     def test_store_and_recall_value(self):
         tis.store_value("x", 42)
@@ -22,6 +30,37 @@ class TestTiSystem(unittest.TestCase):
         tis.store_list("arr", data)
         self.assertEqual(tis.recall_list("arr"), data)
 
+    def test_lists_are_stored_as_typed_arrays(self):
+        data = [1, 2, 3]
+        tis.store_list("ints", data)
+        data.append(4)  # the store keeps its own copy
+        self.assertEqual(tis._variable_store["ints"].typecode, "q")
+        self.assertEqual(tis.recall_list("ints"), [1, 2, 3])
+        tis.store_list("floats", [1, 2.5])
+        self.assertEqual(tis._variable_store["floats"].typecode, "d")
+        tis.store_list("big", [2**70 + 1, 0.5])  # too wide for array('q'), kept exact
+        self.assertEqual(tis.recall_list("big"), [2**70 + 1, 0.5])
+        self.assertRaises(OverflowError, tis.recall_array, "big")
+        self.assertRaises(TypeError, tis.store_list, "bad", [2**70, "x"])
+
+    def test_recall_array_view_and_copy(self):
+        tis.store_list("v", [1.5, 2.5])
+        view = tis.recall_array("v")
+        self.assertIsInstance(view, memoryview)
+        self.assertTrue(view.readonly)
+        self.assertEqual(view.tolist(), [1.5, 2.5])
+        copy = tis.recall_array("v", copy=True)
+        copy[0] = 9.0
+        self.assertEqual(tis.recall_list("v"), [1.5, 2.5])
+        with self.assertRaises(TypeError):
+            tis.recall_array("missing")
+
+    def test_memory_usage_per_variable(self):
+        tis.store_list("small", [1])
+        tis.store_list("large", list(range(1000)))
+        usage = tis.get_memory_usage()
+        self.assertGreater(usage["large"], usage["small"] + 7000)
+
     def test_recall_list_type_error(self):
         tis.store_value("bad", "notalist")
         with self.assertRaises(TypeError):
@@ -41,6 +80,45 @@ class TestTiSystem(unittest.TestCase):
         with self.assertRaises(ValueError):
             tis.eval_function("f", 3)
 
+    def test_eval_function_many_list(self):
+        tis.store_value("sq", lambda x: x * x)
+        self.assertEqual(tis.eval_function_many("sq", [1, 2, 3]), [1, 4, 9])
+        with self.assertRaises(ValueError):
+            tis.eval_function_many("missing", [1])
+
+    def test_eval_function_many_numpy(self):
+        import numpy as np
+        calls = []
+        def vectorized(x):
+            calls.append(x)
+            return np.sin(x)
+        def scalar_only(x):
+            if isinstance(x, np.ndarray):
+                raise TypeError("scalars only")
+            return 2 * x
+        xs = np.linspace(0, 1, 1000)
+        tis.store_value("v", vectorized)
+        self.assertTrue(np.allclose(tis.eval_function_many("v", xs), np.sin(xs)))
+        self.assertEqual(len(calls), 1)
+        tis.store_value("s", scalar_only)
+        self.assertTrue(np.allclose(tis.eval_function_many("s", xs), 2 * xs))
+
+    def test_memoize_function(self):
+        calls = []
+        def f(x):
+            calls.append(x)
+            return x + 1
+        tis.store_value("f", f)
+        tis.memoize_function("f", maxsize=2)
+        self.assertEqual([tis.eval_function("f", v) for v in (1, 1, 2, 1)], [2, 2, 3, 2])
+        self.assertEqual(calls, [1, 2])
+        stats = tis.get_function_cache_stats("f")
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        tis.memoize_function("f", 0)
+        self.assertIs(tis.recall_value("f"), f)
+        with self.assertRaises(ValueError):
+            tis.get_function_cache_stats("f")
+
     def test_get_platform(self):
         self.assertEqual(tis.get_platform(), "hh")
 
@@ -94,6 +172,472 @@ class TestTiSystem(unittest.TestCase):
         self.assertEqual(result, "x")
 
         tis._get_key_from_pygame = old  # restore
+    def test_wait_key_sleeps_in_event_wait(self):
+        waited = []
+        def fake_wait(timeout=0):
+            waited.append(timeout)
+            if len(waited) == 1:
+                return types.SimpleNamespace(type=tis.pygame.NOEVENT)
+            return types.SimpleNamespace(type=tis.pygame.KEYDOWN, key=tis.pygame.K_c)
+        old = tis.pygame.event.get, tis.pygame.event.wait
+        tis.pygame.event.get = lambda: []
+        tis.pygame.event.wait = fake_wait
+        try:
+            self.assertEqual(tis.wait_key(), "c")
+        finally:
+            tis.pygame.event.get, tis.pygame.event.wait = old
+        self.assertEqual(waited, [0, 0])
+
+    def test_wait_key_timeout(self):
+        old = tis.pygame.event.get, tis.pygame.event.wait
+        tis.pygame.event.get = lambda: []
+        tis.pygame.event.wait = lambda timeout=0: types.SimpleNamespace(type=tis.pygame.NOEVENT)
+        try:
+            self.assertEqual(tis.wait_key(0.02), "")
+        finally:
+            tis.pygame.event.get, tis.pygame.event.wait = old
+
+    def test_wait_key_falls_back_to_stdin(self):
+        def raise_error(timeout=None):
+            raise tis.pygame.error("video system not initialized")
+        old = tis._wait_key_from_pygame, tis._wait_key_from_stdin
+        tis._wait_key_from_pygame = raise_error
+        tis._wait_key_from_stdin = lambda timeout=None: "y"
+        try:
+            self.assertEqual(tis.wait_key(1), "y")
+        finally:
+            tis._wait_key_from_pygame, tis._wait_key_from_stdin = old
+
+    def _feed(self, *keys):
+        events = [types.SimpleNamespace(type=tis.pygame.KEYDOWN, key=k, mod=0) for k in keys]
+        def fake_event_get():
+            batch = events[:]
+            events.clear()
+            return batch
+        tis.pygame.event.get = fake_event_get
+
+    def test_fast_keys_are_not_lost(self):
+        pg = tis.pygame
+        self._feed(pg.K_a, pg.K_b, pg.K_c)
+        self.assertEqual([tis.get_key() for _ in range(4)], ["a", "b", "c", ""])
+
+    def test_drain_and_peek(self):
+        pg = tis.pygame
+        self._feed(pg.K_UP, pg.K_x)
+        self.assertEqual(tis.peek_event().key, "up")
+        events = tis.drain_events()
+        self.assertEqual([e.key for e in events], ["up", "x"])
+        self.assertLessEqual(events[0].time_ms, events[1].time_ms)
+        self.assertIsNone(tis.peek_event())
+
+    def test_coalesce(self):
+        pg = tis.pygame
+        self._feed(pg.K_UP, pg.K_UP, pg.K_UP, pg.K_a, pg.K_a)
+        self.assertEqual(tis.coalesce_events(keys={"up"}), 2)
+        self.assertEqual([e.key for e in tis.drain_events()], ["up", "a", "a"])
+
+    def test_overflow_stats(self):
+        tis.set_event_queue_size(2)
+        try:
+            for k in "abc":
+                tis._push_key(k)
+            stats = tis.get_event_stats()
+            self.assertEqual((stats["depth"], stats["dropped"], stats["pushed"]), (2, 1, 3))
+            tis.pygame.event.get = lambda: []
+            self.assertEqual(tis.get_key(), "b")
+        finally:
+            tis.set_event_queue_size(256)
+
+    def _stdin_pipe(self):
+        r, w = os.pipe()
+        self.addCleanup(os.close, r)
+        self.addCleanup(os.close, w)
+        tis.pygame.event.get = lambda: []
+        return tis._StdinReader(r), w
+
+    def test_stdin_reader_decodes_keys(self):
+        reader, w = self._stdin_pipe()
+        os.write(w, "a\x1b[A\x1bOD\x1b[3~\x7f\né".encode())
+        self.assertTrue(reader.read(0))
+        self.assertEqual([e.key for e in tis.drain_events()],
+                         ["a", "up", "left", "del", "del", "enter", "é"])
+
+    def test_stdin_reader_split_sequence_and_esc(self):
+        reader, w = self._stdin_pipe()
+        os.write(w, b"\x1b[")
+        reader.read(0)
+        self.assertEqual(tis.drain_events(), [])
+        os.write(w, b"B\x1b")
+        reader.read(0)
+        self.assertEqual([e.key for e in tis.drain_events()], ["down", "esc"])
+
+    def test_stdin_reader_drops_unknown_sequences(self):
+        reader, w = self._stdin_pipe()
+        # Home, PgUp, F1, Ctrl+Right, then F5 split across two reads
+        os.write(w, b"a\x1b[H\x1b[5~\x1bOP\x1b[1;5Cb\x1b[15")
+        reader.read(0)
+        self.assertEqual([e.key for e in tis.drain_events()], ["a", "b"])
+        os.write(w, b"~c")
+        reader.read(0)
+        self.assertEqual([e.key for e in tis.drain_events()], ["c"])
+
+    def test_stdin_reader_from_file(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b"ab\n")
+            f.seek(0)
+            tis.pygame.event.get = lambda: []
+            reader = tis._StdinReader(f.fileno())
+            self.assertTrue(reader.read(0))
+            self.assertEqual([e.key for e in tis.drain_events()], ["a", "b", "enter"])
+            self.assertFalse(reader.read(None))
+            self.assertTrue(reader.eof)
+
+    def test_stdin_reader_timeout(self):
+        reader, w = self._stdin_pipe()
+        t = time.perf_counter()
+        self.assertFalse(reader.read(0.02))
+        self.assertGreaterEqual(time.perf_counter() - t, 0.015)
+
+    def test_import_is_lazy_and_fast(self):
+        # Fresh interpreter: importing the non-graphical modules (and ti_draw)
+        # must not load pygame, and should take well under 250ms.
+        code = (
+            "import sys, time\n"
+            "t = time.perf_counter()\n"
+            "import ti_system, log, fileio, ti_draw\n"
+            "print(time.perf_counter() - t, 'pygame' in sys.modules)\n"
+        )
+        here = os.path.dirname(os.path.abspath(__file__))
+        out = subprocess.run([sys.executable, "-c", code], cwd=here,
+                             capture_output=True, text=True, check=True)
+        elapsed, loaded = out.stdout.split()
+        self.assertEqual(loaded, "False")
+        self.assertLess(float(elapsed), 0.25)
+
+class TestClock(unittest.TestCase):
+    def tearDown(self):
+        tis.set_clock("real")
+
+    def test_virtual_clock_is_manual(self):
+        tis.set_clock("virtual")
+        t1 = tis.get_time_ms()
+        time.sleep(0.01)
+        self.assertEqual(tis.get_time_ms(), t1)
+        tis.advance_time(250)
+        tis.sleep(1.5)
+        self.assertEqual(tis.get_time_ms(), t1 + 1750)
+        self.assertEqual(tis.get_clock(), ("virtual", 1.0))
+
+    def test_switching_clocks_never_jumps_back(self):
+        tis.set_clock("virtual")
+        tis.advance_time(10000)
+        t1 = tis.get_time_ms()
+        tis.set_clock("real")
+        self.assertGreaterEqual(tis.get_time_ms(), t1)
+
+    def test_scaled_clock(self):
+        tis.set_clock("scaled", 100)
+        t1 = tis.get_time_ms()
+        time.sleep(0.02)
+        self.assertGreaterEqual(tis.get_time_ms() - t1, 1900)
+        start = time.perf_counter()
+        tis.sleep(1)  # 10ms of real time
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            tis.set_clock("fast")
+        with self.assertRaises(ValueError):
+            tis.set_clock("scaled", 0)
+        with self.assertRaises(ValueError):
+            tis.advance_time(5)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        tis._variable_store.clear()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "vars.tisn")
+
+    def tearDown(self):
+        tis._variable_store.clear()
+        tis._snapshot_index.clear()
+        self.dir.cleanup()
+
+    def test_round_trip_is_lazy(self):
+        tis.store_value("n", 7)
+        tis.store_value("s", "text")
+        tis.store_list("file", [104, 105, 10])
+        tis.store_list("xs", [0.5, 1.5])
+        tis.store_value("f", lambda x: x)
+        self.assertEqual(tis.snapshot(self.path), 4)
+        tis.store_value("later", 1)
+        self.assertEqual(tis.restore(self.path), 4)
+        self.assertEqual(tis._variable_store, {})
+        self.assertIsNone(tis.recall_value("later"))
+        self.assertEqual(tis.recall_list("file"), [104, 105, 10])
+        self.assertEqual(list(tis._variable_store), ["file"])
+        self.assertEqual(tis.recall_value("n"), 7)
+        self.assertEqual(tis.recall_value("s"), "text")
+        self.assertEqual(tis.recall_list("xs"), [0.5, 1.5])
+        self.assertIsNone(tis.recall_value("f"))
+
+    def test_snapshot_of_lazily_restored_store(self):
+        for i in range(300):
+            tis.store_list(f"file{i}", list(range(i)))
+        tis.snapshot(self.path)
+        tis.restore(self.path)
+        tis.store_value("file0", 5)  # shadows the image
+        copy = self.path + "2"
+        self.assertEqual(tis.snapshot(copy), 300)
+        tis.restore(copy, lazy=False)
+        self.assertEqual(len(tis._variable_store), 300)
+        self.assertEqual(tis.recall_value("file0"), 5)
+        self.assertEqual(tis.recall_list("file299"), list(range(299)))
+
+    def test_not_a_snapshot(self):
+        with open(self.path, "wb") as f:
+            f.write(b"nope")
+        with self.assertRaises(ValueError):
+            tis.restore(self.path)
+
+    def test_restore_writes_through_persistent_store(self):
+        tis.store_value("keep", 1)
+        tis.snapshot(self.path)
+        tis._variable_store.clear()
+        log = os.path.join(self.dir.name, "vars.tivs")
+        tis.open_store(log)
+        try:
+            tis.store_value("stale", 2)
+            tis.flush_store()
+            tis.restore(self.path)
+            tis.close_store()
+            tis._variable_store.clear()
+            tis.open_store(log)
+            self.assertEqual(tis.recall_value("keep"), 1)
+            self.assertIsNone(tis.recall_value("stale"))
+        finally:
+            tis.close_store()
+
+
+class TestMemoryModel(unittest.TestCase):
+    def setUp(self):
+        tis._variable_store.clear()
+        tis._recount_memory()
+        tis.reset_memory_growth()
+
+    def tearDown(self):
+        tis.set_memory_quota(None)
+        tis.set_clock("real")
+        tis._variable_store.clear()
+        tis._snapshot_index.clear()
+        tis._recount_memory()
+
+    def test_calculator_sizes(self):
+        tis.store_value("x", 1.5)
+        tis.store_value("msg", "hello!")
+        tis.store_list("file", list(range(100)))
+        report = tis.get_memory_report(top=2)
+        self.assertEqual(report["largest"], [("file", 8 + 4 + 2 + 900), ("msg", 8 + 3 + 2 + 6)])
+        self.assertEqual(report["variables"], 3)
+        self.assertEqual(report["total"], 914 + 19 + 8 + 1 + 9)
+        self.assertIsNone(report["free"])
+
+    def test_quota(self):
+        tis.set_memory_quota(200)
+        tis.store_list("a", list(range(10)))  # 8 + 1 + 2 + 90
+        with self.assertRaises(MemoryError):
+            tis.store_list("b", list(range(10)))
+        self.assertIsNone(tis.recall_value("b"))
+        tis.store_list("a", list(range(15)))  # replacing frees the old value
+        self.assertEqual(tis.get_memory_report()["free"], 200 - 146)
+
+    def test_growth_rate(self):
+        tis.set_clock("virtual")
+        tis.reset_memory_growth()
+        tis.store_list("log", [])
+        tis.advance_time(2000)
+        tis.store_list("log", list(range(100)))
+        self.assertAlmostEqual(tis.get_memory_report()["growth_bytes_per_s"], (13 + 900) / 2)
+
+    def test_mixed_list_size_does_not_change_on_load(self):
+        value = [1, "ab", [2.5, 3], True, None]
+        data = tis._encode_value(value)
+        self.assertEqual(tis._encoded_ti_size(data, 0, len(data)), tis._ti_size(value))
+
+    def test_lazy_snapshot_values_count(self):
+        tis.store_list("file", list(range(10)))
+        before = tis.get_memory_report()["total"]
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "img")
+            tis.snapshot(path)
+            tis.restore(path)
+            self.assertEqual(tis._variable_store, {})
+            self.assertEqual(tis.get_memory_report()["total"], before)
+            tis._snapshot_map.close()
+            tis._snapshot_map = None
+            tis._snapshot_index.clear()
+
+
+class TestPersistentStore(unittest.TestCase):
+    def setUp(self):
+        tis._variable_store.clear()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "vars.tivs")
+        tis.open_store(self.path)
+
+    def tearDown(self):
+        tis.close_store()
+        tis._variable_store.clear()
+        self.dir.cleanup()
+
+    def reopen(self):
+        tis.close_store()
+        tis._variable_store.clear()
+        tis.open_store(self.path)
+
+    def test_memory_counts_unloaded_variables(self):
+        tis.store_value("mixed", [1, "ab", 2.5])
+        tis.store_list("xs", list(range(10)))
+        before = tis.get_memory_report()["total"]
+        self.reopen()
+        self.assertEqual(tis.get_memory_report()["total"], before)
+        tis.recall_value("mixed")
+        self.assertEqual(tis.get_memory_report()["total"], before)
+        tis.close_store()
+        self.assertEqual(tis.get_memory_report()["variables"], 1)
+
+    def test_snapshot_includes_unloaded_variables(self):
+        tis.store_value("n", 42)
+        tis.store_list("xs", [1, 2.5])
+        self.reopen()
+        tis.recall_value("n")
+        image = os.path.join(self.dir.name, "vars.tisn")
+        self.assertEqual(tis.snapshot(image), 2)
+        tis.close_store()
+        tis._variable_store.clear()
+        self.assertEqual(tis.restore(image), 2)
+        self.assertEqual(tis.recall_value("n"), 42)
+        self.assertEqual(tis.recall_list("xs"), [1, 2.5])
+
+    def test_lazy_restore_is_written_to_a_later_store(self):
+        tis.close_store()
+        tis.store_value("n", 42)
+        image = os.path.join(self.dir.name, "vars.tisn")
+        tis.snapshot(image)
+        tis._variable_store.clear()
+        tis.restore(image, lazy=True)
+        tis.open_store(self.path)
+        tis.close_store()
+        tis._snapshot_index.clear()  # a fresh process only has the log
+        self.reopen()
+        self.assertEqual(tis.recall_value("n"), 42)
+
+    def test_values_survive_restart(self):
+        tis.store_value("n", 42)
+        tis.store_value("big", 2**80)
+        tis.store_value("s", "héllo")
+        tis.store_list("ints", [1, 2, 3])
+        tis.store_list("floats", [1, 2.5, True])
+        tis.store_value("mixed", [1, 2.5, True])
+        self.reopen()
+        self.assertEqual(tis._variable_store, {})  # nothing loaded yet
+        self.assertEqual(tis.recall_value("n"), 42)
+        self.assertEqual(tis.recall_value("big"), 2**80)
+        self.assertEqual(tis.recall_value("s"), "héllo")
+        self.assertEqual(tis.recall_list("ints"), [1, 2, 3])
+        self.assertEqual(tis.recall_list("floats"), [1.0, 2.5, 1.0])
+        mixed = tis.recall_value("mixed")
+        self.assertEqual(mixed, [1, 2.5, True])
+        self.assertIs(type(mixed[0]), int)
+        self.assertIsNone(tis.recall_value("missing"))
+
+    def test_writes_are_batched(self):
+        old = tis._flush_interval
+        tis._flush_interval = 3600
+        try:
+            tis.store_value("a", 1)
+            tis.store_value("a", 2)
+            self.assertEqual(tis.get_store_stats()["dirty"], 1)
+            self.assertEqual(os.path.getsize(self.path), len(tis._STORE_MAGIC))
+            tis.flush_store()
+            self.assertEqual(tis.get_store_stats()["dirty"], 0)
+        finally:
+            tis._flush_interval = old
+        self.reopen()
+        self.assertEqual(tis.recall_value("a"), 2)
+
+    def test_functions_are_not_persisted(self):
+        tis.store_value("f", 1)
+        tis.flush_store()
+        tis.store_value("f", lambda x: x)
+        self.reopen()
+        self.assertIsNone(tis.recall_value("f"))
+
+    def test_compaction_keeps_latest_values(self):
+        for i in range(50):
+            tis.store_list("file", list(range(i)))
+            tis.flush_store()
+        tis.store_value("other", "x")
+        before = tis.get_store_stats()
+        tis.compact_store()
+        after = tis.get_store_stats()
+        self.assertEqual(after["garbage"], 0)
+        self.assertLess(after["bytes"], before["bytes"])
+        self.reopen()
+        self.assertEqual(tis.recall_list("file"), list(range(49)))
+        self.assertEqual(tis.recall_value("other"), "x")
+
+    def test_compaction_keeps_writes_made_during_the_copy(self):
+        for i in range(20):
+            tis.store_value("a", i)
+            tis.flush_store()
+        tis.store_value("b", 1)
+        tis.store_value("gone", 1)
+        tis.flush_store()
+        copy = tis._copy_records
+
+        def copy_while_writing(*args):
+            index = copy(*args)
+            tis.store_value("a", "new")  # the lock is free during the copy
+            tis.store_value("c", 3)
+            tis.store_value("gone", lambda: 0)  # not persistable: dropped from the log
+            return index
+
+        tis._copy_records = copy_while_writing
+        try:
+            tis.compact_store()
+        finally:
+            tis._copy_records = copy
+        stats = tis.get_store_stats()
+        self.reopen()
+        self.assertEqual(tis.get_store_stats()["garbage"], stats["garbage"])
+        self.assertEqual(tis.recall_value("a"), "new")
+        self.assertEqual(tis.recall_value("b"), 1)
+        self.assertEqual(tis.recall_value("c"), 3)
+        self.assertIsNone(tis.recall_value("gone"))
+
+    def test_close_does_not_start_compaction(self):
+        tis._store_compactor = None
+        tis.store_list("xs", list(range(1000)))
+        for i in range(20):  # pile up garbage without a flush_store
+            tis._store_dirty.add("xs")
+            tis._write_dirty()
+        tis.store_value("n", 1)
+        tis.close_store()
+        self.assertIsNone(tis._store_compactor)
+
+    def test_torn_tail_is_dropped(self):
+        tis.store_value("a", 1)
+        tis.flush_store()
+        tis.close_store()
+        with open(self.path, "ab") as f:
+            f.write(b"\x01\x05\x00")
+        tis._variable_store.clear()
+        tis.open_store(self.path)
+        self.assertEqual(tis.recall_value("a"), 1)
+        self.assertEqual(tis.get_store_stats()["garbage"], 0)
+
 
 if __name__ == "__main__":
     unittest.main()
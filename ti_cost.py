@@ -0,0 +1,230 @@
+# ti_cost.py
+# Estimates how long code would take on the handheld. While estimating, it
+# counts Python bytecodes executed by program code, every public ti_draw call
+# (bulk calls count one call per item, as the device has no bulk drawing),
+# pixels drawn and presented, and ti_system API calls. It then prices them
+# with a per-operation cost model.
+# PC only: it relies on sys.settrace, ti_draw recording and the profiling hooks.
+
+import os
+import struct
+import sys
+
+import ti_draw as td
+import ti_system as tis
+
+# Seconds per operation on a TI-Nspire CX II. These are rough starting
+# figures: time a few programs on a real device and adjust with set_costs().
+# "draw:<name>" / "system:<name>" override the generic per-call cost.
+_costs = {
+    "bytecode": 2e-6,
+    "draw_call": 1.5e-3,
+    "draw_pixel": 4e-8,
+    "present": 5e-3,
+    "present_pixel": 1.5e-7,
+    "system_call": 5e-4,
+    "draw:draw_text": 4e-3,
+    "draw:set_color": 2e-5,
+    "draw:set_pen": 2e-5,
+    "draw:set_window": 2e-5,
+    "draw:use_buffer": 2e-5,
+    "draw:compile_buffer": 2e-5,
+    "draw:end_frame": 2e-5,
+    "system:store_list": 2e-3,
+    "system:get_key": 2e-4,
+}
+
+# Modules that are built into the calculator firmware: their Python bytecode
+# here stands for native code there, so it is not counted.
+_native_files = {"ti_draw.py", "ti_system.py", "ti_plotlib.py", "ti_cost.py"}
+_program_dir = os.path.dirname(os.path.abspath(__file__))
+_counted_dirs = {_program_dir}  # program code: files directly in these...
+_counted_files = set()  # ...and these files (see start(paths=...))
+
+# Bulk ti_draw calls and the single call each item costs on the device
+_bulk_calls = {"plot_xy_many": "plot_xy", "fill_circles_many": "fill_circle",
+               "draw_lines_many": "draw_line", "fill_rects_many": "fill_rect",
+               "draw_polyline": "draw_line", "stamp_many": "draw_line"}
+
+_active = False
+_bytecodes = 0
+_draw_calls = {}  # ti_draw name -> [calls, items]
+_traced = {}  # code object -> whether its bytecode is counted
+_prev_trace = None  # tracer installed before start(), put back by stop()
+_last = None  # totals at the last mark()
+_marks = []  # (label, estimated seconds)
+
+
+class _CallCounter:
+    """Takes the place of a recording stream: counts ti_draw calls instead of storing them."""
+    def __init__(self):
+        self.header = True
+
+    def write(self, data):
+        if self.header:  # start_recording writes the magic first
+            self.header = False
+            return
+        name = td._rec_ops[data[0] - 1][0]
+        items = 1
+        if name in _bulk_calls:  # the first array's length is the item count
+            items = struct.unpack_from("<I", data, 1)[0]
+            if name == "draw_polyline":
+                items = max(items - 1, 0)  # segments
+            elif name == "stamp_many":  # lines per marker is the last argument
+                items *= struct.unpack_from("<i", data, len(data) - 4)[0]
+        entry = _draw_calls.get(name)
+        if entry is None:
+            entry = _draw_calls[name] = [0, 0]
+        entry[0] += 1
+        entry[1] += items
+
+
+def _count_opcodes(frame, event, arg):
+    global _bytecodes
+    if event == "opcode":
+        _bytecodes += 1
+    return _count_opcodes
+
+def _trace_calls(frame, event, arg):
+    code = frame.f_code
+    counted = _traced.get(code)
+    if counted is None:
+        path = os.path.abspath(code.co_filename)
+        counted = _traced[code] = ((path in _counted_files or os.path.dirname(path) in _counted_dirs)
+                                   and os.path.basename(path) not in _native_files)
+    if not counted:
+        return None
+    frame.f_trace_opcodes = True
+    return _count_opcodes
+
+
+def start(paths=None):
+    """
+    Start counting. This resets ti_draw's and ti_system's profiles, and
+    ti_draw must not already be recording. `paths` lists the program's files
+    and directories (the .py files directly in them); only their bytecode is
+    counted. By default that is the directory of this module.
+    Any tracer already set (a coverage tool, a debugger) is paused until stop().
+    """
+    global _active, _bytecodes, _last, _prev_trace
+    if _active:
+        raise RuntimeError("cost estimation is already running")
+    if td._recorder is not None:
+        raise RuntimeError("ti_draw is recording; stop_recording() first")
+    _counted_dirs.clear()
+    _counted_files.clear()
+    for path in [_program_dir] if paths is None else paths:
+        path = os.path.abspath(path)
+        (_counted_dirs if os.path.isdir(path) else _counted_files).add(path)
+    _traced.clear()
+    _bytecodes = 0
+    _draw_calls.clear()
+    _marks.clear()
+    td.reset_profile()
+    td.start_profiling()
+    td.start_recording(_CallCounter())
+    tis.reset_profile()
+    tis.start_profiling()
+    _active = True
+    _last = _totals()
+    _prev_trace = sys.gettrace()
+    sys.settrace(_trace_calls)
+
+def stop() -> dict:
+    """Stop counting and return report()."""
+    global _active, _prev_trace
+    if _active:
+        sys.settrace(_prev_trace)
+        _prev_trace = None
+        td.stop_recording()
+        td.stop_profiling()
+        tis.stop_profiling()
+        _active = False
+    return report()
+
+def measure(func, *args, paths=None, **kwargs):
+    """
+    Run func(*args, **kwargs) under the estimator; returns (result, report).
+    paths is passed to start().
+    """
+    start(paths)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        rep = stop()
+    return result, rep
+
+
+def _totals() -> dict:
+    draw = td.get_profile()
+    present = draw.pop("present", None) or {"calls": 0, "pixels": 0}
+    draw.pop("paint_buffer", None)
+    return {
+        "bytecodes": _bytecodes,
+        "draw_calls": {name: tuple(entry) for name, entry in _draw_calls.items()},
+        "draw_pixels": sum(entry["pixels"] for entry in draw.values()),
+        "presents": present["calls"],
+        "present_pixels": present["pixels"],
+        "system_calls": tis.get_profile(),
+    }
+
+def _diff(now, before) -> dict:
+    out = {k: now[k] - before[k] for k in ("bytecodes", "draw_pixels", "presents", "present_pixels")}
+    out["draw_calls"] = {}
+    for name, (calls, items) in now["draw_calls"].items():
+        old_calls, old_items = before["draw_calls"].get(name, (0, 0))
+        if calls != old_calls:
+            out["draw_calls"][name] = (calls - old_calls, items - old_items)
+    out["system_calls"] = {name: n - before["system_calls"].get(name, 0)
+                           for name, n in now["system_calls"].items()
+                           if n != before["system_calls"].get(name, 0)}
+    return out
+
+def estimate(totals: dict) -> dict:
+    """Price a totals dict (as in report()["counts"]): seconds per category."""
+    c = _costs
+    python = totals["bytecodes"] * c["bytecode"]
+    draw = totals["draw_pixels"] * c["draw_pixel"]
+    for name, (_, items) in totals["draw_calls"].items():
+        draw += items * c.get("draw:" + _bulk_calls.get(name, name), c["draw_call"])
+    present = totals["presents"] * c["present"] + totals["present_pixels"] * c["present_pixel"]
+    system = sum(n * c.get("system:" + name, c["system_call"])
+                 for name, n in totals["system_calls"].items())
+    return {"python": python, "draw": draw, "present": present, "system": system,
+            "total": python + draw + present + system}
+
+def mark(label: str = "frame") -> float:
+    """
+    Close a segment (a frame, a command) and return its estimated device
+    seconds; the segments are listed in report()["marks"].
+    """
+    global _last
+    now = _totals()
+    seconds = estimate(_diff(now, _last))["total"]
+    _last = now
+    _marks.append((label, seconds))
+    return seconds
+
+def report() -> dict:
+    """
+    counts: everything counted since start(); estimate: estimated device
+    seconds by category; marks: (label, seconds) per mark() with their
+    mean and max.
+    """
+    counts = _totals()
+    seconds = [s for _, s in _marks]
+    return {
+        "counts": counts,
+        "estimate": estimate(counts),
+        "marks": list(_marks),
+        "mark_mean": sum(seconds) / len(seconds) if seconds else 0.0,
+        "mark_max": max(seconds, default=0.0),
+    }
+
+
+def set_costs(**costs):
+    """Override entries of the cost model, e.g. set_costs(bytecode=3e-6)."""
+    _costs.update(costs)
+
+def get_costs() -> dict:
+    return dict(_costs)
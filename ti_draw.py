@@ -1,13 +1,29 @@
 # ti_draw_pygame.py
-import pygame
 from typing import Union, List, Tuple
 import math
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+# pygame and numpy are imported by _init() on the first call that draws, so
+# importing ti_draw stays cheap. numpy is optional (bulk drawing, frame arrays).
+np = None
 
 # ---------------- Initialization ----------------
-pygame.init()
+# Backends:
+#   "pygame"   - draw into _surface and present it in a real window
+#   "headless" - draw into _surface only; no window, no display.update
+_backends = ("pygame", "headless")
+_backend = os.environ.get("TI_DRAW_BACKEND", "pygame").lower()
+if _backend not in _backends:
+    raise ValueError(f"Unknown TI_DRAW_BACKEND '{_backend}', expected one of {_backends}")
+
 _screen_dim = [318, 212]
-_screen = pygame.display.set_mode(_screen_dim)
-_surface = pygame.Surface(_screen_dim)
+_screen = None
+_surface = None  # created by _init()
 
 # Internal state
 _color = (0, 0, 0)
@@ -15,18 +31,120 @@ _pen_thickness = "thin"
 _pen_style = "solid"
 _buffer_mode = False
 _buffer_actions = []
+_recorder = None  # binary stream receiving public calls, see start_recording()
+_rec_lists = 0  # display lists compiled since start_recording(), used as their ids
+
+# Retained layers (begin_layer / composite_layers), bottom layer first
+_layers = OrderedDict()
+_current_layer = None  # layer receiving draw ops between begin_layer/end_layer
+_layers_background = None  # background used by the last composite
+
+# Dirty-rectangle tracking: areas of _surface changed since the last present
+_dirty_rects = []
+_max_dirty_rects = 32  # past this, collapse everything into one bounding rect
+_present_stats = {"frames": 0, "skipped": 0, "last_pixels": 0, "last_rects": 0, "total_pixels": 0}
+
+# Clipping: primitives are clipped to the screen grown by a guard band, so
+# strokes poking in from outside still render and pygame never sees huge
+# coordinates. Counts primitives (or bulk items) culled and clipped.
+_clip_guard = 64
+_max_text_width = 4096
+_cull_stats = {"culled": 0, "clipped": 0}
+_fill_batch_area = 64  # fill_rects_many writes rects up to this many pixels in one batch
+
+# Arc tessellation: unit-circle lookup tables (built on first use, 1/8 degree
+# resolution) and an LRU of pie polygons keyed by pixel size and angles.
+_trig_steps = 2880
+_unit_cos = None
+_unit_sin = None
+_arc_cache = OrderedDict()
+_arc_cache_size = 512
+_arc_cache_stats = {"hits": 0, "misses": 0}
+
+# Render thread (start_render_thread): draw calls become commands that the
+# caller appends to _render_pending; flush() hands that list over as one batch
+# and starts a fresh one, so the two threads never share a list being filled.
+_render_thread = None
+_render_pending = []
+_render_queue = deque()  # flushed batches waiting for the render thread
+_render_cond = threading.Condition()
+_render_batch = 512  # auto-flush after this many pending commands
+_render_submitted = 0
+_render_done = 0
+_render_stop = False
+_render_error = None
+_render_present = False  # a present is due; the caller does it at the next sync()
+
+# Profiling (start_profiling): None when off, so hooks cost one global check.
+# Otherwise maps a primitive name (or "paint_buffer"/"present") to
+# [calls, seconds, pixels].
+_profile = None
+_profile_last = {}  # report kept by stop_profiling()
+_profile_clock = time.perf_counter
+
+# Frame pacing (end_frame): target period, per-frame work times, counters.
+# _frame_clock/_frame_sleep are module hooks so pacing can follow another clock.
+_frame_clock = time.perf_counter
+_frame_sleep = time.sleep
+_frame_period = 0.0  # seconds; 0 disables pacing
+_frame_start = None
+_frame_times = deque(maxlen=600)  # work time of recent frames, seconds
+_frame_stats = {"frames": 0, "dropped": 0, "presented": 0, "idle": 0, "slept": 0.0}
 
 # Map pen thickness
 _pen_widths = {"thin": 1, "medium": 3, "thick": 5}
 
-# Font for draw_text
-_font = pygame.font.SysFont("Arial", 12)
+# Pen styles other than "solid": (on, off) lengths in pixels along the path.
+# An "on" length of 0 means one dot per period.
+_dash_patterns = {"dashed": (8.0, 6.0), "dotted": (0.0, 5.0)}
+
+# Font for draw_text, loaded by _init()
+_font = None
+
+# Rendered text surfaces, LRU keyed by (text, color, font). Strings longer than
+# _text_cache_max_len skip this cache and are composed from the glyph atlas.
+_text_cache = OrderedDict()
+_text_cache_size = 256
+_text_cache_max_len = 64
+_glyph_cache = OrderedDict()
+_glyph_cache_size = 1024
+_text_cache_stats = {"hits": 0, "misses": 0, "evictions": 0,
+                     "glyph_hits": 0, "glyph_misses": 0, "glyph_evictions": 0}
 
 # Window defaults
 _window_coords = [0, 318, 0, 212]  # xmin, xmax, ymin, ymax
 _screen_dim = [318, 212]  # in pixels
 
 
+def _init():
+    """Import pygame (and numpy if present), then set up the surface, window and font."""
+    global pygame, np, _surface, _screen, _font
+    import pygame
+    try:
+        import numpy
+        np = numpy
+    except ImportError:
+        np = None
+    if _backend == "headless":
+        pygame.font.init()
+    else:
+        pygame.init()
+        _screen = pygame.display.set_mode(_screen_dim)
+    _surface = pygame.Surface(_screen_dim)
+    _font = pygame.font.SysFont("Arial", 12)
+
+def _ensure_init():
+    if _surface is None:
+        _init()
+
+def __getattr__(name):
+    # `ti_draw.pygame` before the first draw call initializes lazily
+    if name == "pygame":
+        _init()
+        return pygame
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # ---------------- Utility Functions ----------------
 
 def _apply_pen():
@@ -34,153 +152,1250 @@ def _apply_pen():
     width = _pen_widths.get(_pen_thickness, 1)
     return width
 
-def _run_or_buffer(func, *args, **kwargs):
-    if _buffer_mode:
-        _buffer_actions.append((func, args, kwargs))
+def _run_or_buffer(op):
+    """
+    Queue a resolved draw op while buffering (or into the layer being built),
+    otherwise rasterize it right away.
+    Ops carry the color/pen/window state from the moment they were issued.
+    """
+    if op is None:  # culled: entirely off-window
+        return
+    if _current_layer is not None:
+        _current_layer.ops.append(op)
+    elif _buffer_mode:
+        _buffer_actions.append(op)
     else:
-        func(*args, **kwargs)
+        _ensure_init()
+        if _render_thread is not None:
+            _submit(_rasterize, _surface, op)
+        else:
+            _rasterize(_surface, op)
+
+def _mark_dirty(rect):
+    """
+    Record a changed area of _surface (a pygame.Rect as returned by pygame.draw).
+    Overlapping rects are merged so each pixel is pushed at most once per frame.
+    """
+    rect = rect.clip(_surface.get_rect())
+    if rect.width <= 0 or rect.height <= 0:
+        return
+    merged = True
+    while merged:
+        merged = False
+        for i, other in enumerate(_dirty_rects):
+            if rect.colliderect(other):
+                rect = rect.union(_dirty_rects.pop(i))
+                merged = True
+                break
+    _dirty_rects.append(rect)
+    if len(_dirty_rects) > _max_dirty_rects:
+        bounds = _dirty_rects[0].unionall(_dirty_rects[1:])
+        _dirty_rects[:] = [bounds]
+
+def _present():
+    """
+    Push the dirty parts of _surface to the window and reset the dirty list.
+    The headless backend keeps the statistics but never touches a display.
+    With the render thread running this is deferred to the next sync(): SDL
+    wants the window updated from the thread that created it.
+    """
+    global _render_present
+    _ensure_init()
+    if _render_thread is not None:
+        _render_present = True
+    else:
+        _present_now()
+
+def _present_now():
+    """Present on this thread; returns the pixels pushed (0 if nothing was dirty)."""
+    if _profile is not None:
+        start = _profile_clock()
+        pixels = _present_rects()
+        _profile_add("present", _profile_clock() - start, pixels)
+        return pixels
+    return _present_rects()
+
+def _present_rects():
+    if not _dirty_rects:
+        _present_stats["skipped"] += 1
+        return 0
+    rects = list(_dirty_rects)
+    _dirty_rects.clear()
+    pixels = sum(r.width * r.height for r in rects)
+    _present_stats["frames"] += 1
+    _present_stats["last_pixels"] = pixels
+    _present_stats["last_rects"] = len(rects)
+    _present_stats["total_pixels"] += pixels
+    if _screen is None:
+        return pixels
+    for r in rects:
+        _screen.blit(_surface, r, r)
+    pygame.display.update(rects)
+    return pixels
 
 # ---------------- Primitive Drawing ----------------
+# Every primitive is split in two steps:
+#   _resolve_* maps world coords to pixels and captures the current state,
+#              returning an op tuple (kind, color, width, style, data)
+#   _raster_*  draws one op onto a surface and returns the touched pygame.Rect
 
 def _color_val():
-    """Return pygame.Color object from _color tuple"""
-    return pygame.Color(*_color)
+    """Return the current color as a plain (r, g, b) tuple"""
+    return tuple(_color)
+
+def _cull():
+    _cull_stats["culled"] += 1
+    return None
+
+def _clip_box(width=0):
+    """Screen rect grown by the guard band (and pen width): (xmin, ymin, xmax, ymax)."""
+    g = _clip_guard + width
+    w, h = _screen_dim
+    return (-g, -g, w + g, h + g)
+
+def _finite(*values):
+    return all(math.isfinite(v) for v in values)
+
+def _outcode(x, y, box):
+    xmin, ymin, xmax, ymax = box
+    code = 0
+    if x < xmin:
+        code |= 1
+    elif x > xmax:
+        code |= 2
+    if y < ymin:
+        code |= 4
+    elif y > ymax:
+        code |= 8
+    return code
+
+def _clip_segment(x1, y1, x2, y2, box):
+    """
+    Cohen-Sutherland: clip a pixel-space segment to box.
+    Returns the (possibly shortened) segment, or None if nothing is visible.
+    """
+    if not _finite(x1, y1, x2, y2):
+        return None
+    xmin, ymin, xmax, ymax = box
+    c1 = _outcode(x1, y1, box)
+    c2 = _outcode(x2, y2, box)
+    clipped = False
+    while True:
+        if not (c1 | c2):
+            if clipped:
+                _cull_stats["clipped"] += 1
+            return x1, y1, x2, y2
+        if c1 & c2:
+            return None
+        clipped = True
+        c = c1 or c2
+        # interpolate with t in [0, 1] first so huge coordinates cannot overflow
+        if c & 8:
+            x, y = x1 + (x2 - x1) * ((ymax - y1) / (y2 - y1)), ymax
+        elif c & 4:
+            x, y = x1 + (x2 - x1) * ((ymin - y1) / (y2 - y1)), ymin
+        elif c & 2:
+            x, y = xmax, y1 + (y2 - y1) * ((xmax - x1) / (x2 - x1))
+        else:
+            x, y = xmin, y1 + (y2 - y1) * ((xmin - x1) / (x2 - x1))
+        if c == c1:
+            x1, y1 = x, y
+            c1 = _outcode(x1, y1, box)
+        else:
+            x2, y2 = x, y
+            c2 = _outcode(x2, y2, box)
+
+def _clip_rect(left, top, right, bottom, box):
+    """Trivially reject or clamp an axis-aligned pixel rect to box."""
+    if not _finite(left, top, right, bottom):
+        return None
+    xmin, ymin, xmax, ymax = box
+    if right < xmin or left > xmax or bottom < ymin or top > ymax:
+        return None
+    clamped = (max(left, xmin), max(top, ymin), min(right, xmax), min(bottom, ymax))
+    if clamped != (left, top, right, bottom):
+        _cull_stats["clipped"] += 1
+    return clamped
+
+def _clip_polygon(points, box):
+    """Sutherland-Hodgman: clip a pixel-space polygon to box (may return [])."""
+    xmin, ymin, xmax, ymax = box
+    edges = (
+        (lambda p: p[0] >= xmin, lambda p, q: (xmin, p[1] + (q[1] - p[1]) * ((xmin - p[0]) / (q[0] - p[0])))),
+        (lambda p: p[0] <= xmax, lambda p, q: (xmax, p[1] + (q[1] - p[1]) * ((xmax - p[0]) / (q[0] - p[0])))),
+        (lambda p: p[1] >= ymin, lambda p, q: (p[0] + (q[0] - p[0]) * ((ymin - p[1]) / (q[1] - p[1])), ymin)),
+        (lambda p: p[1] <= ymax, lambda p, q: (p[0] + (q[0] - p[0]) * ((ymax - p[1]) / (q[1] - p[1])), ymax)),
+    )
+    for inside, intersect in edges:
+        if not points:
+            break
+        out = []
+        prev = points[-1]
+        for cur in points:
+            if inside(cur):
+                if not inside(prev):
+                    out.append(intersect(prev, cur))
+                out.append(cur)
+            elif inside(prev):
+                out.append(intersect(prev, cur))
+            prev = cur
+        points = out
+    return points
 
-def _draw_line_impl(x1, x2, y1, y2):
-    x1, y1 = _map_coords(x1, y1)
-    x2, y2 = _map_coords(x2, y2)
+def _resolve_poly_points(points, color, width, style):
+    """Shared tail of polygon-like resolves: reject, clip if needed, round to pixels."""
+    if not points:
+        return _cull()
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    # the sums are only non-finite if some coordinate is (or they are enormous)
+    if not _finite(sum(xs), sum(ys)) and not _finite(*xs, *ys):
+        return _cull()
+    box = _clip_box(width)
+    if max(xs) < box[0] or min(xs) > box[2] or max(ys) < box[1] or min(ys) > box[3]:
+        return _cull()
+    if min(xs) < box[0] or max(xs) > box[2] or min(ys) < box[1] or max(ys) > box[3]:
+        points = _clip_polygon(points, box)
+        if len(points) < 2:
+            return _cull()
+        _cull_stats["clipped"] += 1
+    return ("poly", color, width, style, [(int(x), int(y)) for x, y in points])
+
+def _resolve_line(x1, x2, y1, y2):
     width = _apply_pen()
-    pygame.draw.line(_surface, _color_val(), (x1, y1), (x2, y2), width)
+    x1, y1 = _map_coords_f(x1, y1)
+    x2, y2 = _map_coords_f(x2, y2)
+    seg = _clip_segment(x1, y1, x2, y2, _clip_box(width))
+    if seg is None:
+        return _cull()
+    return ("line", _color_val(), width, _pen_style, tuple(int(v) for v in seg))
 
-def _draw_rect_impl(x1, x2, y1, y2, fill=False):
-    x1, y1 = _map_coords(x1, y1)
-    x2, y2 = _map_coords(x2, y2)
-    rect = pygame.Rect(x1, y1, x2 - x1, y2 - y1)
+def _resolve_rect(x1, x2, y1, y2, fill=False):
     width = 0 if fill else _apply_pen()
-    pygame.draw.rect(_surface, _color_val(), rect, width)
+    x1, y1 = _map_coords_f(x1, y1)
+    x2, y2 = _map_coords_f(x2, y2)
+    # the y axis is inverted, so normalize to a positive width/height
+    clipped = _clip_rect(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), _clip_box(width))
+    if clipped is None:
+        return _cull()
+    left, top, right, bottom = (int(v) for v in clipped)
+    return ("rect", _color_val(), width, _pen_style, (left, top, right - left, bottom - top))
 
-def _draw_circle_impl(x, y, radius, fill=False):
-    x, y = _map_coords(x, y)
+def _resolve_circle(x, y, radius, fill=False):
     width = 0 if fill else _apply_pen()
-    pygame.draw.circle(_surface, _color_val(), (x, y), radius, width)
+    x, y = _map_coords_f(x, y)
+    if _clip_rect(x - radius, y - radius, x + radius, y + radius, _clip_box(width)) is None:
+        return _cull()
+    return ("circle", _color_val(), width, _pen_style, (int(x), int(y), radius))
 
-def _draw_text_impl(x, y, text):
-    x, y = _map_coords(x, y)
-    text_surface = _font.render(text, True, _color_val())
-    _surface.blit(text_surface, (x, y))
+def _resolve_text(x, y, text):
+    x, y = _map_coords_f(x, y)
+    w, h = _screen_dim
+    # text extends right and down from its anchor
+    if not _finite(x, y) or x >= w or y >= h or x < -_max_text_width or y < -_clip_guard:
+        return _cull()
+    return ("text", _color_val(), 0, "solid", (int(x), int(y), str(text)))
 
-def _draw_poly_impl(xlist, ylist, fill=False):
-    points = [_map_coords(x, y) for x, y in zip(xlist, ylist)]
+def _resolve_poly(xlist, ylist, fill=False):
+    points = [_map_coords_f(x, y) for x, y in zip(xlist, ylist)]
     width = 0 if fill else _apply_pen()
-    pygame.draw.polygon(_surface, _color_val(), points, width)
+    return _resolve_poly_points(points, _color_val(), width, _pen_style)
+
+def _trig_tables():
+    """Unit-circle cos/sin lookup tables with _trig_steps samples per turn."""
+    global _unit_cos, _unit_sin
+    if _unit_cos is None:
+        k = 2 * math.pi / _trig_steps
+        _unit_cos = [math.cos(i * k) for i in range(_trig_steps)]
+        _unit_sin = [math.sin(i * k) for i in range(_trig_steps)]
+    return _unit_cos, _unit_sin
+
+def _unit_points(start_deg, sweep_deg, steps):
+    """(cos, sin) of steps+1 evenly spaced angles, read from the lookup tables."""
+    cos_t, sin_t = _trig_tables()
+    scale = _trig_steps / 360.0
+    points = []
+    for i in range(steps + 1):
+        idx = int(round((start_deg + sweep_deg * i / steps) * scale)) % _trig_steps
+        points.append((cos_t[idx], sin_t[idx]))
+    return points
+
+def _arc_polygon(w, h, start_deg, sweep_deg):
+    """
+    Pie-slice polygon of the w x h ellipse in whole pixels, relative to its
+    bounding rect's top-left, using pygame's angle convention (counterclockwise, y up).
+    Cached by (w, h, start, sweep) so repeated arcs are tessellated once.
+    """
+    key = (w, h, start_deg, sweep_deg)
+    points = _arc_cache.get(key)
+    if points is not None:
+        _arc_cache.move_to_end(key)
+        _arc_cache_stats["hits"] += 1
+        return points
+    _arc_cache_stats["misses"] += 1
+    steps = max(6, int(abs(sweep_deg) / 5))  # at least 6 points
+    rx, ry = w / 2, h / 2
+    points = [(int(rx), int(ry))]  # center
+    points.extend((int(rx + rx * c), int(ry - ry * s)) for c, s in _unit_points(start_deg, sweep_deg, steps))
+    _arc_cache[key] = points
+    if len(_arc_cache) > _arc_cache_size:
+        _arc_cache.popitem(last=False)
+    return points
 
-def _draw_arc_impl(x, y, width, height, startAngle, arcAngle, fill=False):
+def _resolve_arc(x, y, width, height, startAngle, arcAngle, fill=False):
     """
-    Draw an elliptical arc.
+    Resolve an elliptical arc.
     x, y = top-left of bounding rectangle
     width, height = size of ellipse
     startAngle, arcAngle in degrees
     fill = whether to fill the arc
     """
-    x0, y0 = _map_coords(x, y)
-    x1, y1 = _map_coords(x+width, y+height)
-    width = x1 - x0
-    height = y1 - y0
+    x0, y0 = _map_coords_f(x, y)
+    x1, y1 = _map_coords_f(x+width, y+height)
+    if not _finite(x0, y0, x1, y1):
+        return _cull()
+    # the y axis is inverted, so normalize to a positive width/height; the size
+    # is rounded (not truncated) so equal arcs get equal cache keys anywhere
+    left, top = int(min(x0, x1)), int(min(y0, y1))
+    w, h = int(round(abs(x1 - x0))), int(round(abs(y1 - y0)))
+    pen = 0 if fill else _apply_pen()
+    box = _clip_box(pen)
+    clipped = _clip_rect(left, top, left + w, top + h, box)
+    if clipped is None:
+        return _cull()
 
-    rect = pygame.Rect(x, y, width, height)
+    if fill:
+        # Approximate filled arc using a cached polygon along the ellipse
+        polygon = _arc_polygon(w, h, startAngle, arcAngle)
+        if clipped != (left, top, left + w, top + h):
+            points = [(left + px, top + py) for px, py in polygon]
+            return _resolve_poly_points(points, _color_val(), 0, _pen_style)
+        return ("poly", _color_val(), 0, _pen_style, [(left + px, top + py) for px, py in polygon])
+    # Unfilled arc
     start_rad = math.radians(startAngle)
     end_rad = math.radians(startAngle + arcAngle)
+    return ("arc", _color_val(), pen, _pen_style, ((left, top, w, h), start_rad, end_rad))
 
-    if fill:
-        # Approximate filled arc using polygon with many points along the ellipse
-        steps = max(6, int(abs(arcAngle)/5))  # at least 6 points
-        points = [(x + width/2, y + height/2)]  # center
-        for i in range(steps + 1):
-            theta = start_rad + (end_rad - start_rad) * (i / steps)
-            px = x + width/2 + (width/2) * math.cos(theta)
-            py = y + height/2 + (height/2) * math.sin(theta)
-            points.append((px, py))
-        pygame.draw.polygon(_surface, _color_val(), points)
-    else:
-        # Unfilled arc
-        pygame.draw.arc(_surface, _color_val(), rect, start_rad, end_rad, _apply_pen())
+def _map_coords_f(x, y):
+    """
+    Map virtual coordinates to (unrounded) pixel coordinates on the Pygame surface.
+    """
+    xmin, xmax, ymin, ymax = _window_coords
+    w, h = _screen_dim
+    px = (x - xmin) / (xmax - xmin) * w
+    py = h - (y - ymin) / (ymax - ymin) * h  # invert y-axis
+    return px, py
 
 def _map_coords(x, y):
     """
     Map virtual coordinates to pixel coordinates on the Pygame surface.
     """
+    px, py = _map_coords_f(x, y)
+    return int(px), int(py)
+
+def _map_coords_many(xs, ys):
+    """
+    Vectorized _map_coords_f over two equal-length sequences (lists,
+    array.array, NumPy arrays, ...). Returns unrounded pixel columns/rows as
+    float NumPy arrays when numpy is available, plain float lists otherwise.
+    """
+    if np is None:
+        pts = [_map_coords_f(x, y) for x, y in zip(xs, ys)]
+        return [p[0] for p in pts], [p[1] for p in pts]
+    x = np.asarray(xs, dtype=np.float64)
+    y = np.asarray(ys, dtype=np.float64)
+    if x.shape != y.shape:
+        raise ValueError("x and y sequences must have the same length")
     xmin, xmax, ymin, ymax = _window_coords
     w, h = _screen_dim
-    px = int((x - xmin) / (xmax - xmin) * w)
-    py = int(h - (y - ymin) / (ymax - ymin) * h)  # invert y-axis
+    px = (x - xmin) / (xmax - xmin) * w
+    py = h - (y - ymin) / (ymax - ymin) * h
     return px, py
 
+def _tolist(seq):
+    return seq.tolist() if hasattr(seq, "tolist") else list(seq)
+
+_circle_offsets_cache = {}
+
+def _circle_offsets(radius):
+    """Pixel offsets covered by pygame.draw.circle(..., radius) around its center."""
+    offsets = _circle_offsets_cache.get(radius)
+    if offsets is None:
+        size = 2 * radius + 2
+        stamp = pygame.Surface((size, size))
+        pygame.draw.circle(stamp, (255, 255, 255), (radius + 1, radius + 1), radius)
+        offsets = [(px - radius - 1, py - radius - 1)
+                   for px in range(size) for py in range(size)
+                   if stamp.get_at((px, py))[0]]
+        _circle_offsets_cache[radius] = offsets
+    return offsets
+
+def _resolve_points(xs, ys, radius, offsets=None):
+    """
+    Points stamped with a radius `radius` disc, or with the pixel `offsets`
+    when given (radius is then their reach, used for culling).
+    """
+    pxs, pys = _map_coords_many(xs, ys)
+    w, h = _screen_dim
+    if np is not None:
+        keep = (np.isfinite(pxs) & np.isfinite(pys)
+                & (pxs > -radius - 1) & (pxs < w + radius) & (pys > -radius - 1) & (pys < h + radius))
+        culled = int(keep.size - np.count_nonzero(keep))
+        pxs = pxs[keep].astype(np.int64)
+        pys = pys[keep].astype(np.int64)
+    else:
+        kept = [(int(x), int(y)) for x, y in zip(pxs, pys)
+                if _finite(x, y) and -radius - 1 < x < w + radius and -radius - 1 < y < h + radius]
+        culled = len(pxs) - len(kept)
+        pxs, pys = [p[0] for p in kept], [p[1] for p in kept]
+    _cull_stats["culled"] += culled
+    if not len(pxs):
+        return None
+    return ("points", _color_val(), 0, "solid", (pxs, pys, radius, offsets))
+
+def _clip_many(segs, box):
+    """
+    Clip an (n, 4) float array of segments in place; returns the mask of
+    segments left visible. The trivial accepts/rejects are done as masks and
+    only the segments crossing the clip box go through Cohen-Sutherland.
+    """
+    xmin, ymin, xmax, ymax = box
+    xs, ys = segs[:, 0::2], segs[:, 1::2]
+    finite = np.isfinite(segs).all(axis=1)
+    inside = finite & ((xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax)).all(axis=1)
+    outside = (~finite | (xs < xmin).all(axis=1) | (xs > xmax).all(axis=1)
+               | (ys < ymin).all(axis=1) | (ys > ymax).all(axis=1))
+    keep = inside.copy()
+    for i in np.flatnonzero(~inside & ~outside).tolist():
+        seg = _clip_segment(*segs[i].tolist(), box)
+        if seg is not None:
+            segs[i] = seg
+            keep[i] = True
+    _cull_stats["culled"] += int(keep.size - np.count_nonzero(keep))
+    return keep
+
+def _segments_op(ax, ay, bx, by, width):
+    """Clip pixel-space segments (four float sequences) into one "segments" op."""
+    box = _clip_box(width)
+    if np is not None and isinstance(ax, np.ndarray):
+        segs = np.column_stack((ax, ay, bx, by))
+        segments = segs[_clip_many(segs, box)].astype(np.int64).tolist()
+    else:
+        segments = []
+        for x1, y1, x2, y2 in zip(ax, ay, bx, by):
+            seg = _clip_segment(x1, y1, x2, y2, box)
+            if seg is None:
+                _cull_stats["culled"] += 1
+            else:
+                segments.append(tuple(int(v) for v in seg))
+    if not segments:
+        return None
+    return ("segments", _color_val(), width, _pen_style, segments)
+
+def _runs_op(pxs, pys, width):
+    """
+    Clip a pixel-space polyline that leaves the clip box into the runs of
+    connected segments still visible, dropping consecutive repeated points.
+    One run is a "lines" op, several a "runs" op (one pygame.draw.lines each).
+    """
+    box = _clip_box(width)
+    if np is not None and isinstance(pxs, np.ndarray):
+        # thin out the visible points first, as the fast path does: clipping
+        # only has to look at one segment per pixel step
+        xmin, ymin, xmax, ymax = box
+        inside = (pxs >= xmin) & (pxs <= xmax) & (pys >= ymin) & (pys <= ymax)  # False for NaN
+        with np.errstate(invalid="ignore"):
+            ixs, iys = pxs.astype(np.int64), pys.astype(np.int64)
+        keep = np.ones(len(pxs), dtype=bool)
+        keep[1:] = ~(inside[1:] & inside[:-1] & (ixs[1:] == ixs[:-1]) & (iys[1:] == iys[:-1]))
+        pxs, pys = pxs[keep], pys[keep]
+        segs = np.column_stack((pxs[:-1], pys[:-1], pxs[1:], pys[1:]))
+        keep = _clip_many(segs, box)
+        index = np.flatnonzero(keep)
+        if not index.size:
+            return None
+        segs = segs[keep].astype(np.int64)
+        # a run breaks where a segment was culled or clipped away from its neighbour
+        new_run = np.ones(len(segs), dtype=bool)
+        new_run[1:] = (index[1:] != index[:-1] + 1) | (segs[1:, :2] != segs[:-1, 2:]).any(axis=1)
+        # each segment adds its end point, and its start point when it opens a run
+        take = np.column_stack((new_run, np.ones_like(new_run))).ravel()
+        points = segs.reshape(-1, 2)[take]
+        starts = np.column_stack((new_run, np.zeros_like(new_run))).ravel()[take]
+        keep = starts.copy()
+        keep[1:] |= (points[1:] != points[:-1]).any(axis=1)
+        points, starts = points[keep], starts[keep]
+        runs = [run.tolist() for run in np.split(points, np.flatnonzero(starts)[1:])]
+    else:
+        runs = []
+        run = None
+        for x1, y1, x2, y2 in zip(pxs[:-1], pys[:-1], pxs[1:], pys[1:]):
+            seg = _clip_segment(x1, y1, x2, y2, box)
+            if seg is None:
+                _cull_stats["culled"] += 1
+                run = None
+                continue
+            a, b = (int(seg[0]), int(seg[1])), (int(seg[2]), int(seg[3]))
+            if run is None or run[-1] != a:
+                run = [a]
+                runs.append(run)
+            if b != run[-1]:
+                run.append(b)
+        if not runs:
+            return None
+    for run in runs:
+        if len(run) == 1:
+            run.append(run[0])
+    if len(runs) == 1:
+        return ("lines", _color_val(), width, _pen_style, runs[0])
+    return ("runs", _color_val(), width, _pen_style, runs)
+
+def _resolve_segments(x1s, x2s, y1s, y2s):
+    ax, ay = _map_coords_many(x1s, y1s)
+    bx, by = _map_coords_many(x2s, y2s)
+    return _segments_op(ax, ay, bx, by, _apply_pen())
+
+def _resolve_polyline(xlist, ylist):
+    width = _apply_pen()
+    box = _clip_box(width)
+    pxs, pys = _map_coords_many(xlist, ylist)
+    if np is not None and isinstance(pxs, np.ndarray):
+        if (np.isfinite(pxs).all() and np.isfinite(pys).all()
+                and box[0] <= pxs.min() and pxs.max() <= box[2]
+                and box[1] <= pys.min() and pys.max() <= box[3]):
+            # dense data maps many points onto one pixel: drop consecutive repeats
+            points = np.column_stack((pxs, pys)).astype(np.int64)
+            keep = np.ones(len(points), dtype=bool)
+            keep[1:] = (points[1:] != points[:-1]).any(axis=1)
+            points = points[keep].tolist()
+            if len(points) == 1:
+                points.append(points[0])
+            return ("lines", _color_val(), width, _pen_style, points)
+        # partly off-window: clip, then chain each visible run like the fast path
+        return _runs_op(pxs, pys, width)
+    pxs, pys = _tolist(pxs), _tolist(pys)
+    if (_finite(*pxs, *pys) and box[0] <= min(pxs) and max(pxs) <= box[2]
+            and box[1] <= min(pys) and max(pys) <= box[3]):
+        points = [(int(x), int(y)) for x, y in zip(pxs, pys)]
+        return ("lines", _color_val(), width, _pen_style, points)
+    # partly off-window: clip, then chain each visible run
+    return _runs_op(pxs, pys, width)
+
+def _resolve_fills(xs, ys, widths, heights):
+    if np is not None:
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        x2s = xs + np.asarray(widths, dtype=np.float64)
+        y2s = ys + np.asarray(heights, dtype=np.float64)
+    else:
+        x2s = [x + w for x, w in zip(xs, widths)]
+        y2s = [y + h for y, h in zip(ys, heights)]
+    ax, ay = _map_coords_many(xs, ys)
+    bx, by = _map_coords_many(x2s, y2s)
+    box = _clip_box()
+    if np is not None:
+        # the y axis is inverted, so normalize to a positive width/height
+        xmin, ymin, xmax, ymax = box
+        corners = np.column_stack((np.minimum(ax, bx), np.minimum(ay, by),
+                                   np.maximum(ax, bx), np.maximum(ay, by)))
+        left, top, right, bottom = corners.T
+        keep = (np.isfinite(corners).all(axis=1)
+                & (right >= xmin) & (left <= xmax) & (bottom >= ymin) & (top <= ymax))
+        _cull_stats["culled"] += int(keep.size - np.count_nonzero(keep))
+        corners = corners[keep]
+        clamped = np.clip(corners, (xmin, ymin, xmin, ymin), (xmax, ymax, xmax, ymax))
+        _cull_stats["clipped"] += int(np.count_nonzero((clamped != corners).any(axis=1)))
+        if not len(clamped):
+            return None
+        rects = clamped.astype(np.int64)
+        rects[:, 2:] -= rects[:, :2]
+        return ("fills", _color_val(), 0, "solid", rects)
+    rects = []
+    for x1, y1, x2, y2 in zip(_tolist(ax), _tolist(ay), _tolist(bx), _tolist(by)):
+        clipped = _clip_rect(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), box)
+        if clipped is None:
+            _cull_stats["culled"] += 1
+            continue
+        left, top, right, bottom = (int(v) for v in clipped)
+        rects.append((left, top, right - left, bottom - top))
+    if not rects:
+        return None
+    return ("fills", _color_val(), 0, "solid", rects)
+
+def _raster_line(surf, op):
+    _, color, width, _, (x1, y1, x2, y2) = op
+    return pygame.draw.line(surf, color, (x1, y1), (x2, y2), width)
+
+def _raster_lines(surf, op):
+    _, color, width, _, points = op
+    return pygame.draw.lines(surf, color, False, points, width)
+
+def _raster_runs(surf, op):
+    _, color, width, _, runs = op
+    lines = pygame.draw.lines
+    rects = [lines(surf, color, False, run, width) for run in runs]
+    return rects[0].unionall(rects[1:])
+
+def _raster_segments(surf, op):
+    _, color, width, _, segments = op
+    line = pygame.draw.line
+    rects = [line(surf, color, (x1, y1), (x2, y2), width) for x1, y1, x2, y2 in segments]
+    return rects[0].unionall(rects[1:])
+
+def _raster_rect(surf, op):
+    _, color, width, _, rect = op
+    return pygame.draw.rect(surf, color, rect, width)
+
+def _fill_rect_array(surf, color, rects):
+    """
+    Fill an (n, 4) array of (left, top, width, height) rects through surfarray:
+    small rects are written as one fancy-indexed batch of pixels, large ones
+    as slices.
+    """
+    w, h = surf.get_size()
+    left = np.clip(rects[:, 0], 0, w)
+    top = np.clip(rects[:, 1], 0, h)
+    right = np.clip(rects[:, 0] + rects[:, 2], 0, w)
+    bottom = np.clip(rects[:, 1] + rects[:, 3], 0, h)
+    keep = (right > left) & (bottom > top)
+    if not keep.any():
+        return pygame.Rect(0, 0, 0, 0)
+    left, top, right, bottom = left[keep], top[keep], right[keep], bottom[keep]
+    widths = right - left
+    areas = widths * (bottom - top)
+    small = areas <= _fill_batch_area
+    # every pixel of the small rects: rect index and offset within the rect
+    counts = areas[small]
+    which = np.repeat(np.arange(counts.size), counts)
+    offset = np.arange(which.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    row = widths[small][which]
+    px = left[small][which] + offset % row
+    py = top[small][which] + offset // row
+    large = np.column_stack((left, top, right, bottom))[~small].tolist()
+    planes = [(pygame.surfarray.pixels3d, color[:3])]
+    if surf.get_flags() & pygame.SRCALPHA:  # layer surfaces start transparent
+        planes.append((pygame.surfarray.pixels_alpha, 255))
+    for plane, value in planes:
+        pixels = plane(surf)
+        pixels[px, py] = value
+        for l, t, r, b in large:
+            pixels[l:r, t:b] = value
+        del pixels  # unlock the surface
+    x, y = int(left.min()), int(top.min())
+    return pygame.Rect(x, y, int(right.max()) - x, int(bottom.max()) - y)
+
+def _raster_fills(surf, op):
+    _, color, _, _, rects = op
+    if np is not None and isinstance(rects, np.ndarray):
+        return _fill_rect_array(surf, color, rects)
+    # clip first: Surface.fill shifts rects that start above or left of the surface
+    bounds = surf.get_rect()
+    fill = surf.fill
+    touched = [fill(color, bounds.clip(r)) for r in rects]
+    return touched[0].unionall(touched[1:])
+
+def _raster_circle(surf, op):
+    _, color, width, _, (x, y, radius) = op
+    return pygame.draw.circle(surf, color, (x, y), radius, width)
+
+def _render_glyph(ch, color):
+    key = (ch, color, _font)
+    glyph = _glyph_cache.get(key)
+    if glyph is not None:
+        _glyph_cache.move_to_end(key)
+        _text_cache_stats["glyph_hits"] += 1
+        return glyph
+    _text_cache_stats["glyph_misses"] += 1
+    glyph = _font.render(ch, True, color)
+    _glyph_cache[key] = glyph
+    if len(_glyph_cache) > _glyph_cache_size:
+        _glyph_cache.popitem(last=False)
+        _text_cache_stats["glyph_evictions"] += 1
+    return glyph
+
+def _render_text(text, color):
+    """Return the rendered surface for text, from the LRU cache when possible."""
+    key = (text, color, _font)
+    cached = _text_cache.get(key)
+    if cached is not None:
+        _text_cache.move_to_end(key)
+        _text_cache_stats["hits"] += 1
+        return cached
+    _text_cache_stats["misses"] += 1
+    rendered = _font.render(text, True, color)
+    if _text_cache_size > 0:
+        _text_cache[key] = rendered
+        if len(_text_cache) > _text_cache_size:
+            _text_cache.popitem(last=False)
+            _text_cache_stats["evictions"] += 1
+    return rendered
+
+def _blit_glyphs(surf, x, y, text, color):
+    """Draw text glyph by glyph from the atlas, advancing by the font metrics."""
+    rects = []
+    for ch, metrics in zip(text, _font.metrics(text)):
+        if metrics is None:  # glyph missing from the font
+            continue
+        rects.append(surf.blit(_render_glyph(ch, color), (x, y)))
+        x += metrics[4]
+    if not rects:
+        return pygame.Rect(x, y, 0, 0)
+    return rects[0].unionall(rects[1:])
+
+def _raster_text(surf, op):
+    _, color, _, _, (x, y, text) = op
+    if len(text) > _text_cache_max_len:
+        return _blit_glyphs(surf, x, y, text, color)
+    return surf.blit(_render_text(text, color), (x, y))
+
+def _raster_poly(surf, op):
+    _, color, width, _, points = op
+    return pygame.draw.polygon(surf, color, points, width)
+
+def _raster_arc(surf, op):
+    _, color, width, _, (rect, start_rad, end_rad) = op
+    return pygame.draw.arc(surf, color, rect, start_rad, end_rad, width)
+
+def _raster_points(surf, op):
+    _, color, _, _, (xs, ys, radius, offsets) = op
+    footprint = _circle_offsets(radius) if offsets is None else offsets
+    if np is not None and isinstance(xs, np.ndarray):
+        w, h = surf.get_size()
+        pixels = pygame.surfarray.pixels3d(surf)
+        for dx, dy in footprint:
+            px = xs + dx
+            py = ys + dy
+            keep = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+            pixels[px[keep], py[keep]] = color[:3]
+        del pixels  # unlock the surface
+        if surf.get_flags() & pygame.SRCALPHA:  # layer surfaces start transparent
+            alpha = pygame.surfarray.pixels_alpha(surf)
+            for dx, dy in footprint:
+                px = xs + dx
+                py = ys + dy
+                keep = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+                alpha[px[keep], py[keep]] = 255
+            del alpha
+        left, top = int(xs.min()) - radius, int(ys.min()) - radius
+        right, bottom = int(xs.max()) + radius, int(ys.max()) + radius
+        return pygame.Rect(left, top, right - left + 1, bottom - top + 1)
+    if offsets is not None:
+        bounds = surf.get_rect()
+        set_at = surf.set_at
+        rects = []
+        for x, y in zip(xs, ys):
+            for dx, dy in offsets:
+                if bounds.collidepoint(x + dx, y + dy):
+                    set_at((x + dx, y + dy), color)
+            rects.append(pygame.Rect(x - radius, y - radius, 2 * radius + 1, 2 * radius + 1))
+        return rects[0].unionall(rects[1:])
+    circle = pygame.draw.circle
+    rects = [circle(surf, color, (x, y), radius) for x, y in zip(xs, ys)]
+    return rects[0].unionall(rects[1:])
+
+def _ellipse_path(cx, cy, rx, ry, start_rad, end_rad):
+    """Points along an ellipse using pygame's angle convention (counterclockwise, y up)."""
+    sweep = end_rad - start_rad
+    perimeter = abs(sweep) * max(rx, ry, 1)
+    steps = max(8, int(perimeter / 2))
+    unit = _unit_points(math.degrees(start_rad), math.degrees(sweep), steps)
+    return [(cx + rx * c, cy - ry * s) for c, s in unit]
+
+def _outline_paths(op):
+    """Pixel-space paths traced by an outlined op, for styled (non-solid) pens."""
+    kind, _, _, _, data = op
+    if kind == "line":
+        x1, y1, x2, y2 = data
+        return [[(x1, y1), (x2, y2)]]
+    if kind == "lines":
+        return [data]
+    if kind == "runs":
+        return data
+    if kind == "segments":
+        return [[(x1, y1), (x2, y2)] for x1, y1, x2, y2 in data]
+    if kind == "rect":
+        left, top, w, h = data
+        right, bottom = left + w - 1, top + h - 1
+        return [[(left, top), (right, top), (right, bottom), (left, bottom), (left, top)]]
+    if kind == "poly":
+        return [list(data) + [data[0]]] if data else []
+    if kind == "circle":
+        x, y, radius = data
+        return [_ellipse_path(x, y, radius, radius, 0, 2 * math.pi)]
+    if kind == "arc":
+        (x, y, w, h), start_rad, end_rad = data
+        return [_ellipse_path(x + w / 2, y + h / 2, w / 2, h / 2, start_rad, end_rad)]
+    return []
+
+def _stroke_styled(surf, color, width, points, style):
+    """
+    Stroke one path with a dash pattern in a single pass. The dash phase runs
+    on across corners, so polylines and outlines stay evenly patterned.
+    """
+    on, off = _dash_patterns[style]
+    period = on + off
+    dot_radius = max(1, width // 2)
+    line = pygame.draw.line
+    rects = []
+    dist = 0.0  # path length walked before the current segment
+    for (x1, y1), (x2, y2) in zip(points, points[1:]):
+        length = math.hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            continue
+        ux, uy = (x2 - x1) / length, (y2 - y1) / length
+        if on == 0:
+            t = -dist % period
+            while t <= length:
+                rects.append(pygame.draw.circle(surf, color, (x1 + ux * t, y1 + uy * t), dot_radius))
+                t += period
+        else:
+            t = -(dist % period)
+            while t < length:
+                a, b = max(t, 0.0), min(t + on, length)
+                if b > a:
+                    rects.append(line(surf, color, (x1 + ux * a, y1 + uy * a),
+                                      (x1 + ux * b, y1 + uy * b), width))
+                t += period
+        dist += length
+    return rects
+
+def _raster_styled(surf, op):
+    _, color, width, style, _ = op
+    rects = []
+    for path in _outline_paths(op):
+        rects.extend(_stroke_styled(surf, color, width, path, style))
+    if not rects:
+        return pygame.Rect(0, 0, 0, 0)
+    return rects[0].unionall(rects[1:])
+
+_rasterizers = {
+    "line": _raster_line,
+    "lines": _raster_lines,
+    "runs": _raster_runs,
+    "segments": _raster_segments,
+    "rect": _raster_rect,
+    "fills": _raster_fills,
+    "circle": _raster_circle,
+    "text": _raster_text,
+    "poly": _raster_poly,
+    "arc": _raster_arc,
+    "points": _raster_points,
+}
+
+def _raster_op(surf, op):
+    if op[2] > 0 and op[3] in _dash_patterns:
+        return _raster_styled(surf, op)
+    return _rasterizers[op[0]](surf, op)
+
+def _path_pixels(points):
+    """Pixels on a 1-pixel polyline: the longer axis of each step, plus the start."""
+    if len(points) < 2:
+        return len(points)
+    if np is not None and len(points) > 64:
+        steps = np.abs(np.diff(np.asarray(points), axis=0))
+        return int(steps.max(axis=1).sum()) + 1
+    return int(sum(max(abs(x2 - x1), abs(y2 - y1))
+                   for (x1, y1), (x2, y2) in zip(points, points[1:]))) + 1
+
+def _op_pixels(op, rect):
+    """
+    Estimate of the pixels an op draws, for the profile: path length times
+    pen width (less the gaps of a dash pattern) for outlines, footprint
+    times count for points, the rects' areas for fills, and the bounding box
+    for filled shapes and text. Never more than the bounding box.
+    """
+    kind, _, width, style, data = op
+    area = rect.width * rect.height
+    if width > 0 and kind not in ("fills", "points", "text"):
+        pixels = sum(_path_pixels(path) for path in _outline_paths(op)) * width
+        if style in _dash_patterns:
+            on, off = _dash_patterns[style]
+            period = on + off
+            pixels = int(pixels * min(max(on, width), period) / period)  # dots are a pen wide
+        return min(pixels, area)
+    if kind == "points":
+        xs, _, radius, offsets = data
+        return min(len(xs) * len(_circle_offsets(radius) if offsets is None else offsets), area)
+    if kind == "fills":
+        if np is not None and isinstance(data, np.ndarray):
+            return min(int((data[:, 2] * data[:, 3]).sum()), area)
+        return min(sum(r[2] * r[3] for r in data), area)
+    return area
+
+def _rasterize(surf, op):
+    if _profile is not None:
+        start = _profile_clock()
+        rect = _raster_op(surf, op)
+        _profile_add(_op_name(op), _profile_clock() - start, _op_pixels(op, rect))
+    else:
+        rect = _raster_op(surf, op)
+    if surf is _surface:
+        _mark_dirty(rect)
+    return rect
+
+
+# ---------------- Display Lists ----------------
+
+def _batch_ops(ops):
+    """
+    Collapse runs of compatible ops into batched ops:
+    - consecutive lines with the same color/pen become one "lines" polyline per
+      connected chain, plus one "segments" op for the disconnected leftovers
+      (dashed and dotted lines all go into the "segments" op)
+    - consecutive filled rects with the same color become one "fills" op
+    Everything else is passed through unchanged, keeping the draw order.
+    """
+    out = []
+    i = 0
+    n = len(ops)
+    while i < n:
+        op = ops[i]
+        kind, color, width, style, data = op
+        j = i + 1
+        if kind == "line":
+            while j < n and ops[j][0] == "line" and ops[j][1:4] == op[1:4]:
+                j += 1
+            if j - i == 1:
+                out.append(op)
+            else:
+                chains = []
+                # a dash pattern restarts with every draw_line, so styled lines stay apart
+                chained = style not in _dash_patterns
+                for _, _, _, _, (x1, y1, x2, y2) in ops[i:j]:
+                    if chained and chains and chains[-1][-1] == (x1, y1):
+                        chains[-1].append((x2, y2))
+                    else:
+                        chains.append([(x1, y1), (x2, y2)])
+                singles = [c[0] + c[1] for c in chains if len(c) == 2]
+                if singles:
+                    out.append(("segments", color, width, style, singles))
+                for c in chains:
+                    if len(c) > 2:
+                        out.append(("lines", color, width, style, c))
+        elif kind == "rect" and width == 0:
+            while j < n and ops[j][0] == "rect" and ops[j][2] == 0 and ops[j][1] == color:
+                j += 1
+            if j - i == 1:
+                out.append(op)
+            else:
+                out.append(("fills", color, 0, style, [o[4] for o in ops[i:j]]))
+        else:
+            out.append(op)
+        i = j
+    return out
+
+class DisplayList:
+    """
+    A compiled, replayable sequence of draw ops.
+    Coordinates, colors and pens are resolved when the list is built, so
+    replaying it only rasterizes: no coordinate mapping or state lookups.
+    """
+
+    def __init__(self, ops):
+        self.ops = _batch_ops(list(ops))
+        self.rec_id = 0  # set by compile_buffer() while recording
+
+    def __len__(self):
+        return len(self.ops)
+
+    def replay(self):
+        """Draw the list (queued instead if buffering is on)."""
+        if _recorder is not None:
+            _record("replay_display_list", self.rec_id)
+        self._draw()
+
+    def _draw(self):
+        for op in self.ops:
+            _run_or_buffer(op)
+
+def _take_buffer():
+    display_list = DisplayList(_buffer_actions)
+    _buffer_actions.clear()
+    return display_list
+
+def compile_buffer() -> DisplayList:
+    """
+    Compile the queued buffer actions into a DisplayList and empty the queue.
+    Keep the result to replay a static scene (e.g. plot axes and grids) many times.
+    """
+    global _rec_lists
+    display_list = _take_buffer()
+    if _recorder is not None:
+        _record("compile_buffer")
+        _rec_lists += 1
+        display_list.rec_id = _rec_lists
+    return display_list
+
+
+# ---------------- Layers ----------------
+# Optional retained mode: each named layer keeps the ops drawn into it and a
+# cached transparent surface. composite_layers() re-rasterizes only layers
+# whose contents changed, then recomposes just the areas they cover.
+
+class _Layer:
+    def __init__(self, name):
+        self.name = name
+        self.ops = []
+        self.surface = None
+        self.bounds = None  # pygame.Rect covered by the last rasterization
+        self.dirty = True
+        self.visible = True
+        self.renders = 0
+
+    def render(self):
+        if self.surface is None:
+            self.surface = pygame.Surface(_screen_dim, pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 0))
+        rects = [_rasterize(self.surface, op) for op in _batch_ops(self.ops)]
+        self.bounds = rects[0].unionall(rects[1:]).clip(self.surface.get_rect()) if rects else None
+        self.dirty = False
+        self.renders += 1
+
+def begin_layer(name: str):
+    """
+    Start (re)drawing layer `name`: its old contents are dropped and every draw
+    call until end_layer() goes into it. New layers are stacked on top.
+    """
+    global _current_layer
+    if _recorder is not None:
+        _record("begin_layer", name)
+    layer = _layers.get(name)
+    if layer is None:
+        layer = _layers[name] = _Layer(name)
+    layer.ops = []
+    layer.dirty = True
+    _current_layer = layer
+
+def end_layer():
+    """Stop drawing into the current layer; draw calls go to the screen again."""
+    global _current_layer
+    if _recorder is not None:
+        _record("end_layer")
+    _current_layer = None
+
+def clear_layer(name: str):
+    if _recorder is not None:
+        _record("clear_layer", name)
+    layer = _layers[name]
+    layer.ops = []
+    layer.dirty = True
+
+def remove_layer(name: str):
+    global _layers_background, _current_layer
+    if _recorder is not None:
+        _record("remove_layer", name)
+    layer = _layers.pop(name)
+    if layer is _current_layer:
+        _current_layer = None
+    _layers_background = None  # its area must be recomposed
+
+def set_layer_visible(name: str, visible: bool):
+    global _layers_background
+    if _recorder is not None:
+        _record("set_layer_visible", name, visible)
+    layer = _layers[name]
+    if layer.visible != visible:
+        layer.visible = visible
+        _layers_background = None
+
+def get_layer_names() -> List[str]:
+    """Layer names from bottom to top."""
+    return list(_layers)
+
+def composite_layers(background=(255, 255, 255)):
+    """
+    Re-rasterize the layers that changed since the last call, compose all
+    visible layers over `background` where something changed, and present.
+    With the render thread running this first waits for it (sync()).
+    """
+    global _layers_background
+    background = tuple(background)
+    if _recorder is not None:
+        _record("composite_layers", *background)
+    _ensure_init()
+    sync()
+    areas = []
+    for layer in _layers.values():
+        if layer.dirty:
+            old = layer.bounds
+            layer.render()
+            for rect in (old, layer.bounds):
+                if rect is not None:
+                    areas.append(rect)
+    if background != _layers_background:
+        areas = [_surface.get_rect()]
+        _layers_background = background
+    for area in areas:
+        _surface.fill(background, area)
+        for layer in _layers.values():
+            if layer.visible and layer.surface is not None:
+                _surface.blit(layer.surface, area, area)
+        _mark_dirty(area)
+    _present()
+
 
 # ---------------- Public API ----------------
 
 def draw_line(x1, x2, y1, y2):
-    _run_or_buffer(_draw_line_impl, x1, x2, y1, y2)
+    if _recorder is not None:
+        _record("draw_line", x1, x2, y1, y2)
+    _run_or_buffer(_resolve_line(x1, x2, y1, y2))
 
 def draw_rect(x, y, width, height):
-    _run_or_buffer(_draw_rect_impl, x, x+width, y, y+height, False)
+    if _recorder is not None:
+        _record("draw_rect", x, y, width, height)
+    _run_or_buffer(_resolve_rect(x, x+width, y, y+height, False))
 
 def fill_rect(x, y, width, height):
-    _run_or_buffer(_draw_rect_impl, x, x+width, y, y+height, True)
+    if _recorder is not None:
+        _record("fill_rect", x, y, width, height)
+    _run_or_buffer(_resolve_rect(x, x+width, y, y+height, True))
 
 def draw_circle(x, y, radius):
-    _run_or_buffer(_draw_circle_impl, x, y, radius, False)
+    if _recorder is not None:
+        _record("draw_circle", x, y, radius)
+    _run_or_buffer(_resolve_circle(x, y, radius, False))
 
 def fill_circle(x, y, radius):
-    _run_or_buffer(_draw_circle_impl, x, y, radius, True)
+    if _recorder is not None:
+        _record("fill_circle", x, y, radius)
+    _run_or_buffer(_resolve_circle(x, y, radius, True))
 
 def draw_text(x, y, text: str):
-    _run_or_buffer(_draw_text_impl, x, y, text)
+    if _recorder is not None:
+        _record("draw_text", x, y, text)
+    _run_or_buffer(_resolve_text(x, y, text))
 
 def draw_poly(xlist: List[Union[int,float]], ylist: List[Union[int,float]]):
-    _run_or_buffer(_draw_poly_impl, xlist, ylist, False)
+    if _recorder is not None:
+        _record("draw_poly", xlist, ylist)
+    _run_or_buffer(_resolve_poly(xlist, ylist, False))
 
 def fill_poly(xlist: List[Union[int,float]], ylist: List[Union[int,float]]):
-    _run_or_buffer(_draw_poly_impl, xlist, ylist, True)
+    if _recorder is not None:
+        _record("fill_poly", xlist, ylist)
+    _run_or_buffer(_resolve_poly(xlist, ylist, True))
 
 def plot_xy(x, y, mode: int = 1):
-    _run_or_buffer(_draw_circle_impl, x, y, 1, True)
+    if _recorder is not None:
+        _record("plot_xy", x, y, mode)
+    _run_or_buffer(_resolve_circle(x, y, 1, True))
 
 def draw_arc(x, y, width, height, startAngle, arcAngle):
-    _run_or_buffer(_draw_arc_impl, x, y, width, height, startAngle, arcAngle, False)
+    if _recorder is not None:
+        _record("draw_arc", x, y, width, height, startAngle, arcAngle)
+    _run_or_buffer(_resolve_arc(x, y, width, height, startAngle, arcAngle, False))
 
 def fill_arc(x, y, width, height, startAngle, arcAngle):
-    _run_or_buffer(_draw_arc_impl, x, y, width, height, startAngle, arcAngle, True)
+    if _recorder is not None:
+        _record("fill_arc", x, y, width, height, startAngle, arcAngle)
+    _run_or_buffer(_resolve_arc(x, y, width, height, startAngle, arcAngle, True))
+
+
+# ---------------- Bulk Drawing ----------------
+# Array-accepting variants of the primitives above. Coordinates for the whole
+# batch are mapped in one vectorized pass and rasterized as a single op.
+
+def plot_xy_many(xs, ys, mode: int = 1):
+    """plot_xy for every (x, y) pair in xs/ys."""
+    if _recorder is not None:
+        _record("plot_xy_many", xs, ys, mode)
+    _ensure_init()
+    if len(xs):
+        _run_or_buffer(_resolve_points(xs, ys, 1))
+
+def fill_circles_many(xs, ys, radius: int):
+    """fill_circle with one pixel radius for every (x, y) pair in xs/ys."""
+    if _recorder is not None:
+        _record("fill_circles_many", xs, ys, radius)
+    _ensure_init()
+    if len(xs):
+        _run_or_buffer(_resolve_points(xs, ys, int(radius)))
+
+def stamp_many(xs, ys, dxs, dys, lines: int = 1):
+    """
+    Set the pixels at offsets (dxs[i], dys[i]) from every (x, y) point in the
+    current color: a custom marker (e.g. a cross) drawn for all points at once.
+    `lines` is how many draw_line calls one marker takes on the device.
+    """
+    if _recorder is not None:
+        _record("stamp_many", xs, ys, dxs, dys, lines)
+    _ensure_init()
+    if len(xs) and len(dxs):
+        offsets = [(int(dx), int(dy)) for dx, dy in zip(dxs, dys)]
+        reach = max(max(abs(dx), abs(dy)) for dx, dy in offsets)
+        _run_or_buffer(_resolve_points(xs, ys, reach, offsets))
+
+def draw_lines_many(x1s, x2s, y1s, y2s):
+    """draw_line for every segment; arguments are ordered like draw_line."""
+    if _recorder is not None:
+        _record("draw_lines_many", x1s, x2s, y1s, y2s)
+    _ensure_init()
+    if len(x1s):
+        _run_or_buffer(_resolve_segments(x1s, x2s, y1s, y2s))
+
+def draw_polyline(xlist, ylist):
+    """Connect consecutive (x, y) points with one polyline."""
+    if _recorder is not None:
+        _record("draw_polyline", xlist, ylist)
+    _ensure_init()
+    if len(xlist) >= 2:
+        _run_or_buffer(_resolve_polyline(xlist, ylist))
+
+def fill_rects_many(xs, ys, widths, heights):
+    """fill_rect for every (x, y, width, height) in the four sequences."""
+    if _recorder is not None:
+        _record("fill_rects_many", xs, ys, widths, heights)
+    _ensure_init()
+    if len(xs):
+        _run_or_buffer(_resolve_fills(xs, ys, widths, heights))
 
 
 # ---------------- Buffering ----------------
 
 def use_buffer():
     global _buffer_mode
+    if _recorder is not None:
+        _record("use_buffer")
     _buffer_mode = True
 
 def paint_buffer():
-    global _buffer_mode, _buffer_actions
-    for func, args, kwargs in _buffer_actions:
-        func(*args, **kwargs)
-    _buffer_actions.clear()
+    global _buffer_mode
+    if _recorder is not None:
+        _record("paint_buffer")
     _buffer_mode = False
-    _screen.blit(_surface, (0,0))
-    pygame.display.update()
+    if _profile is not None:
+        start = _profile_clock()
+        _take_buffer()._draw()
+        _profile_add("paint_buffer", _profile_clock() - start, 0)
+    else:
+        _take_buffer()._draw()
+    _present()
 
 # ---------------- Utilities ----------------
 
+def _clear_now():
+    _mark_dirty(_surface.fill((255,255,255)))
+
 def clear():
-    _surface.fill((255,255,255))
-    _screen.blit(_surface, (0,0))
-    pygame.display.update()
+    if _recorder is not None:
+        _record("clear")
+    _ensure_init()
+    if _render_thread is not None:
+        _submit(_clear_now)
+    else:
+        _clear_now()
+    _present()
 
 def clear_rect(x, y, width, height):
+    global _color
+    if _recorder is not None:
+        _record("clear_rect", x, y, width, height)
     old_color = _color
-    set_color(255, 255, 255)
-    fill_rect(x, y, width, height)
-    set_color(*old_color)
-    _screen.blit(_surface, (0,0))
-    pygame.display.update()
+    _color = (255, 255, 255)
+    _run_or_buffer(_resolve_rect(x, x+width, y, y+height, True))
+    _color = old_color
+    _present()
 
 def set_color(*args: Union[int, Tuple[int,int,int]]):
     global _color
@@ -190,11 +1405,15 @@ def set_color(*args: Union[int, Tuple[int,int,int]]):
         _color = tuple(args)
     else:
         raise ValueError("set_color expects (r,g,b) or ((r,g,b),)")
-        
+    if _recorder is not None:
+        _record("set_color", *_color)
+
 def set_pen(thickness: str, style: str):
     global _pen_thickness, _pen_style
     _pen_thickness = thickness
     _pen_style = style
+    if _recorder is not None:
+        _record("set_pen", thickness, style)
 
 def get_screen_dim() -> List[int]:
     return list(_screen_dim)
@@ -206,12 +1425,495 @@ def set_window(xmin, xmax, ymin, ymax):
     """
     global _window_coords
     _window_coords = [xmin, xmax, ymin, ymax]
+    if _recorder is not None:
+        _record("set_window", xmin, xmax, ymin, ymax)
+
+
+# ---------------- Frame Pacing ----------------
+
+def set_frame_clock(clock=None, sleep=None):
+    """
+    Pace frames with another clock, e.g. ti_system's virtual clock:
+    set_frame_clock(ti_system.clock_seconds, ti_system.sleep). `clock`
+    returns seconds; None restores time.perf_counter / time.sleep.
+    """
+    global _frame_clock, _frame_sleep, _frame_start
+    _frame_clock = clock or time.perf_counter
+    _frame_sleep = sleep or time.sleep
+    _frame_start = None  # readings of the old clock mean nothing now
+
+def set_target_fps(fps):
+    """
+    Pace end_frame() to `fps` frames per second; 0 or None disables pacing
+    (end_frame then only presents and records timings).
+    """
+    global _frame_period
+    _frame_period = 1.0 / fps if fps else 0.0
+
+def end_frame():
+    """
+    Finish the current frame: present what changed (nothing is pushed if the
+    frame drew nothing), record how long the frame's work took, then sleep
+    only for whatever is left of the frame period.
+    Call it once per iteration of a program's main loop instead of sleeping.
+    """
+    global _frame_start
+    if _recorder is not None:
+        _record("end_frame")
+    now = _frame_clock()
+    if _frame_start is None:
+        _frame_start = now
+    if _render_thread is not None:
+        # present on this thread once the frame is rasterized; empty presents are skipped
+        _present()
+        if sync():
+            _frame_stats["presented"] += 1
+        else:
+            _frame_stats["idle"] += 1
+    elif _dirty_rects:
+        _present()
+        _frame_stats["presented"] += 1
+    else:
+        _frame_stats["idle"] += 1
+    now = _frame_clock()
+    work = now - _frame_start
+    _frame_times.append(work)
+    _frame_stats["frames"] += 1
+    if _frame_period:
+        remaining = _frame_period - work
+        if remaining > 0:
+            _frame_sleep(remaining)
+            _frame_stats["slept"] += remaining
+        else:
+            _frame_stats["dropped"] += 1
+    _frame_start = _frame_clock()
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def get_frame_stats() -> dict:
+    """
+    Timing of recent frames (work done between end_frame() calls, excluding
+    the pacing sleep): p50_ms, p95_ms, max_ms over the last 600 frames, plus
+    frames, dropped (over budget), presented, idle (nothing changed, present
+    skipped), slept_ms and target_fps.
+    """
+    times = sorted(_frame_times)
+    return {
+        "frames": _frame_stats["frames"],
+        "dropped": _frame_stats["dropped"],
+        "presented": _frame_stats["presented"],
+        "idle": _frame_stats["idle"],
+        "slept_ms": _frame_stats["slept"] * 1000,
+        "p50_ms": _percentile(times, 0.50) * 1000,
+        "p95_ms": _percentile(times, 0.95) * 1000,
+        "max_ms": (times[-1] if times else 0.0) * 1000,
+        "target_fps": 1.0 / _frame_period if _frame_period else 0,
+    }
+
+def reset_frame_stats():
+    global _frame_start
+    _frame_times.clear()
+    _frame_start = None
+    for k in _frame_stats:
+        _frame_stats[k] = 0
+
+
+# ---------------- Render Thread ----------------
+
+def _submit(func, *args):
+    _render_pending.append((func, args))
+    if len(_render_pending) >= _render_batch:
+        flush()
+
+def _render_loop():
+    global _render_done, _render_error
+    while True:
+        with _render_cond:
+            while not _render_queue and not _render_stop:
+                _render_cond.wait()
+            if not _render_queue:
+                return
+            batch = _render_queue.popleft()
+        try:
+            for func, args in batch:
+                func(*args)
+        except BaseException as e:  # reported to the caller by sync()
+            _render_error = e
+        with _render_cond:
+            _render_done += 1
+            _render_cond.notify_all()
+
+def start_render_thread():
+    """
+    Rasterize on a dedicated thread. Draw calls only queue commands; flush()
+    hands them over, sync() waits until they are drawn and then presents on the
+    calling thread (the window is only touched from there, as SDL requires on
+    macOS). end_frame(), frame reads and composite_layers() sync implicitly.
+    """
+    global _render_thread, _render_stop, _render_error
+    if _render_thread is not None:
+        return
+    _ensure_init()
+    _render_stop = False
+    _render_error = None
+    _render_thread = threading.Thread(target=_render_loop, name="ti_draw-render", daemon=True)
+    _render_thread.start()
+
+def stop_render_thread():
+    """Finish all queued work, then stop the render thread."""
+    global _render_thread, _render_stop
+    if _render_thread is None:
+        return
+    try:
+        sync()
+    finally:
+        with _render_cond:
+            _render_stop = True
+            _render_cond.notify_all()
+        _render_thread.join()
+        _render_thread = None
+
+def flush():
+    """Hand every queued command to the render thread without waiting."""
+    global _render_pending, _render_submitted
+    if _render_thread is None or not _render_pending:
+        return
+    batch, _render_pending = _render_pending, []
+    with _render_cond:
+        _render_queue.append(batch)
+        _render_submitted += 1
+        _render_cond.notify_all()
+
+def sync():
+    """
+    flush(), then block until the render thread has executed everything and
+    do any present requested in the meantime. Returns the pixels presented.
+    """
+    global _render_error, _render_present
+    if _render_thread is None:
+        return 0
+    flush()
+    with _render_cond:
+        while _render_done < _render_submitted:
+            _render_cond.wait()
+    if _render_error is not None:
+        error, _render_error = _render_error, None
+        raise error
+    if _render_present:
+        _render_present = False
+        return _present_now()
+    return 0
+
+
+# ---------------- Profiling ----------------
+
+# Op kinds as named in the profile: (outline name, filled name)
+_op_names = {
+    "line": ("draw_line", "draw_line"),
+    "lines": ("draw_polyline", "draw_polyline"),
+    "runs": ("draw_polyline", "draw_polyline"),
+    "segments": ("draw_lines_many", "draw_lines_many"),
+    "rect": ("draw_rect", "fill_rect"),
+    "fills": ("fill_rects_many", "fill_rects_many"),
+    "circle": ("draw_circle", "fill_circle"),
+    "text": ("draw_text", "draw_text"),
+    "poly": ("draw_poly", "fill_poly"),
+    "arc": ("draw_arc", "fill_arc"),
+    "points": ("plot_xy", "plot_xy"),
+}
+_profile_fields = ("calls", "seconds", "pixels")
+
+def _op_name(op):
+    outline, filled = _op_names[op[0]]
+    return outline if op[2] > 0 else filled
+
+def _profile_add(name, seconds, pixels):
+    entry = _profile.get(name)
+    if entry is None:
+        entry = _profile[name] = [0, 0.0, 0]
+    entry[0] += 1
+    entry[1] += seconds
+    entry[2] += pixels
+
+def start_profiling():
+    """
+    Count calls, wall time and drawn pixels per primitive, plus time spent
+    in paint_buffer and in presenting. Batched ops from display lists show
+    up under their bulk names (draw_polyline, fill_rects_many, ...).
+    """
+    global _profile
+    if _profile is None:
+        _profile = {}
+
+def stop_profiling():
+    """Stop collecting; the report so far stays available."""
+    global _profile
+    if _profile is not None:
+        _profile_last.clear()
+        _profile_last.update(_profile)
+    _profile = None
+
+def get_profile() -> dict:
+    """
+    {name: {"calls", "seconds", "pixels"}} for everything profiled so far.
+    Drawn pixels are estimated from each op's shape (see _op_pixels).
+    """
+    source = _profile if _profile is not None else _profile_last
+    return {name: dict(zip(_profile_fields, entry)) for name, entry in source.items()}
+
+def reset_profile():
+    _profile_last.clear()
+    if _profile is not None:
+        _profile.clear()
+
+def get_profile_csv() -> str:
+    """The profile as CSV text, slowest entries first."""
+    rows = sorted(get_profile().items(), key=lambda item: -item[1]["seconds"])
+    lines = ["name," + ",".join(_profile_fields)]
+    for name, entry in rows:
+        lines.append(f"{name},{entry['calls']},{entry['seconds']:.9f},{entry['pixels']}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- Recording / Replay ----------------
+# A recording is a header followed by one record per public call:
+# an opcode byte, then the arguments packed little-endian according to the
+# op's format string:
+#   d = float64, i = int32, s = uint32 length + utf-8 bytes,
+#   a = uint32 count + that many float64 (lists / arrays of coordinates)
+# Opcodes are positions in _rec_ops (+1): only ever append to this table.
+
+_rec_magic = b"TIDR\x01"
+_rec_ops = [
+    ("set_color", "iii"), ("set_pen", "ss"), ("set_window", "dddd"),
+    ("use_buffer", ""), ("paint_buffer", ""), ("clear", ""), ("clear_rect", "dddd"),
+    ("draw_line", "dddd"), ("draw_rect", "dddd"), ("fill_rect", "dddd"),
+    ("draw_circle", "ddd"), ("fill_circle", "ddd"), ("draw_text", "dds"),
+    ("draw_poly", "aa"), ("fill_poly", "aa"), ("plot_xy", "ddi"),
+    ("draw_arc", "dddddd"), ("fill_arc", "dddddd"),
+    ("plot_xy_many", "aai"), ("fill_circles_many", "aai"), ("draw_lines_many", "aaaa"),
+    ("draw_polyline", "aa"), ("fill_rects_many", "aaaa"),
+    ("begin_layer", "s"), ("end_layer", ""), ("clear_layer", "s"), ("remove_layer", "s"),
+    ("set_layer_visible", "si"), ("composite_layers", "iii"),
+    ("compile_buffer", ""), ("replay_display_list", "i"), ("end_frame", ""),
+    ("stamp_many", "aaaai"),
+]
+_rec_index = {name: (code + 1, fmt) for code, (name, fmt) in enumerate(_rec_ops)}
+_u32 = struct.Struct("<I")
+_f64 = struct.Struct("<d")
+_i32 = struct.Struct("<i")
+_fixed_structs = {}  # fmt -> struct.Struct("<B" + fmt) for formats made only of d/i
+
+def _pack_doubles(seq):
+    if np is not None and not isinstance(seq, array):
+        data = np.ascontiguousarray(seq, dtype="<f8").tobytes()
+    else:
+        data = array("d", seq).tobytes()
+    return _u32.pack(len(data) // 8) + data
+
+def _record(name, *args):
+    code, fmt = _rec_index[name]
+    if "s" not in fmt and "a" not in fmt:
+        packer = _fixed_structs.get(fmt)
+        if packer is None:
+            packer = _fixed_structs[fmt] = struct.Struct("<B" + fmt)
+        values = [int(a) if f == "i" else float(a) for f, a in zip(fmt, args)]
+        _recorder.write(packer.pack(code, *values))
+        return
+    parts = [bytes((code,))]
+    for f, a in zip(fmt, args):
+        if f == "d":
+            parts.append(_f64.pack(a))
+        elif f == "i":
+            parts.append(_i32.pack(int(a)))
+        elif f == "s":
+            data = str(a).encode("utf-8")
+            parts.append(_u32.pack(len(data)) + data)
+        else:
+            parts.append(_pack_doubles(a))
+    _recorder.write(b"".join(parts))
+
+def start_recording(stream):
+    """
+    Record every public ti_draw call from now on into `stream`, a binary
+    file-like object (e.g. open(path, "wb") or io.BytesIO()).
+    Display lists are recorded by reference to their compile_buffer() call, so
+    replaying a list compiled before recording started draws nothing.
+    """
+    global _recorder, _rec_lists
+    stream.write(_rec_magic)
+    _rec_lists = 0
+    _recorder = stream
+
+def stop_recording():
+    """Stop recording; returns the stream that was being written to."""
+    global _recorder
+    stream, _recorder = _recorder, None
+    return stream
+
+def replay(source, on_present=None) -> int:
+    """
+    Replay a recording (bytes or a binary file-like object) through the public
+    API, so it renders on whichever backend is active. on_present, if given, is
+    called after every paint_buffer/clear/clear_rect/composite_layers/end_frame,
+    e.g. to grab get_frame_bytes() for diffing. Returns the number of calls replayed.
+    """
+    data = source if isinstance(source, (bytes, bytearray, memoryview)) else source.read()
+    data = memoryview(data)
+    if bytes(data[:len(_rec_magic)]) != _rec_magic:
+        raise ValueError("not a ti_draw recording")
+    lists = [None]  # display lists by recorded id; 0 = compiled before recording
+
+    def replay_display_list(rec_id):
+        if lists[rec_id] is not None:
+            lists[rec_id].replay()
+
+    funcs = [replay_display_list if name == "replay_display_list" else globals()[name]
+             for name, _ in _rec_ops]
+    presents = ("paint_buffer", "clear", "clear_rect", "composite_layers", "end_frame")
+    pos = len(_rec_magic)
+    count = 0
+    while pos < len(data):
+        code = data[pos]
+        pos += 1
+        name, fmt = _rec_ops[code - 1]
+        args = []
+        for f in fmt:
+            if f == "d":
+                args.append(_f64.unpack_from(data, pos)[0])
+                pos += 8
+            elif f == "i":
+                args.append(_i32.unpack_from(data, pos)[0])
+                pos += 4
+            elif f == "s":
+                n = _u32.unpack_from(data, pos)[0]
+                args.append(bytes(data[pos + 4:pos + 4 + n]).decode("utf-8"))
+                pos += 4 + n
+            else:
+                n = _u32.unpack_from(data, pos)[0]
+                values = array("d")
+                values.frombytes(data[pos + 4:pos + 4 + 8 * n])
+                args.append(values)
+                pos += 4 + 8 * n
+        result = funcs[code - 1](*args)
+        if name == "compile_buffer":
+            lists.append(result)
+        count += 1
+        if on_present is not None and name in presents:
+            on_present()
+    return count
+
+
+# ---------------- Backends / Frame Access ----------------
+
+def set_backend(name: str):
+    """
+    Switch between the "pygame" (windowed) and "headless" backends.
+    The drawing surface and its contents are kept; only presenting changes.
+    """
+    global _backend, _screen
+    name = name.lower()
+    if name not in _backends:
+        raise ValueError(f"Unknown backend '{name}', expected one of {_backends}")
+    if _surface is None:  # not initialized yet; _init() picks the backend up
+        _backend = name
+        return
+    sync()
+    if name == "headless":
+        _screen = None
+    elif _screen is None:
+        pygame.init()
+        _screen = pygame.display.set_mode(_screen_dim)
+        _mark_dirty(_surface.get_rect())  # a new window starts blank
+    _backend = name
+
+def get_backend() -> str:
+    return _backend
+
+def get_present_stats() -> dict:
+    """
+    Counters for presented frames:
+    frames, skipped (presents with nothing dirty), last_pixels / last_rects
+    (pixels and rects pushed by the latest frame) and total_pixels.
+    """
+    return dict(_present_stats)
+
+def reset_present_stats():
+    for k in _present_stats:
+        _present_stats[k] = 0
+
+def get_cull_stats() -> dict:
+    """
+    culled: primitives (or bulk items) dropped as entirely off-window;
+    clipped: primitives cut down to the visible area before rasterizing.
+    """
+    return dict(_cull_stats)
+
+def reset_cull_stats():
+    for k in _cull_stats:
+        _cull_stats[k] = 0
+
+def get_text_cache_stats() -> dict:
+    """
+    Hit/miss/eviction counters for the text surface cache and the glyph atlas,
+    plus their current sizes and limits.
+    """
+    stats = dict(_text_cache_stats)
+    stats["size"] = len(_text_cache)
+    stats["capacity"] = _text_cache_size
+    stats["glyphs"] = len(_glyph_cache)
+    stats["glyph_capacity"] = _glyph_cache_size
+    return stats
+
+def set_text_cache_size(size: int, max_len: int = None, glyphs: int = None):
+    """
+    Resize the text cache (0 disables it). max_len is the longest string that
+    is cached whole; glyphs bounds the per-glyph atlas.
+    """
+    global _text_cache_size, _text_cache_max_len, _glyph_cache_size
+    _text_cache_size = max(0, int(size))
+    if max_len is not None:
+        _text_cache_max_len = int(max_len)
+    if glyphs is not None:
+        _glyph_cache_size = max(1, int(glyphs))
+    while len(_text_cache) > _text_cache_size:
+        _text_cache.popitem(last=False)
+        _text_cache_stats["evictions"] += 1
+    while len(_glyph_cache) > _glyph_cache_size:
+        _glyph_cache.popitem(last=False)
+        _text_cache_stats["glyph_evictions"] += 1
+
+def clear_text_cache():
+    """Drop every cached text surface and glyph, and reset the counters."""
+    _text_cache.clear()
+    _glyph_cache.clear()
+    for k in _text_cache_stats:
+        _text_cache_stats[k] = 0
+
+def get_frame_bytes() -> bytes:
+    """Return the current frame as packed RGB bytes (row-major, width*height*3)."""
+    _ensure_init()
+    sync()
+    return pygame.image.tobytes(_surface, "RGB")
+
+def get_frame_array():
+    """Return the current frame as a (height, width, 3) uint8 NumPy array."""
+    _ensure_init()
+    if np is None:
+        raise ImportError("get_frame_array requires numpy; use get_frame_bytes instead")
+    w, h = _screen_dim
+    return np.frombuffer(get_frame_bytes(), dtype=np.uint8).reshape(h, w, 3)
 
 
 # ---------------- Keyboard Input ----------------
 
 def get_key():
     """Poll pygame events and return key as string if pressed"""
+    _ensure_init()
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             return "QUIT"
@@ -7,14 +7,17 @@ and exposes a TI-like `ti_plotlib` API (commonly imported as `plt`).
 Notes / deviations from real TI:
 - Text is not rotated; y-axis label is placed horizontally at one of three
   horizontal anchors (left third / center / right third).
-- Dashed / dotted lines are approximated in pixel space.
+- Dashed / dotted lines are rasterized by ti_draw from the pen style.
 - Draw order is exactly the call order unless you use buffering.
   If you need the grid/axes behind your data, call `grid()` and `axes()`
   *before* `plot()` / `scatter()`.
 - `show_plot()` always blits & updates the screen (even if not in buffer mode).
+- `plot()` / `scatter()` also take NumPy arrays and `array.array`; sequences
+  are drawn with one bulk ti_draw call per plot, not one call per point.
 """
 
 from typing import Iterable, List, Sequence, Tuple, Union, Optional
+from array import array
 import math
 
 # Import your pygame-backed drawing shim
@@ -39,6 +42,9 @@ _current_pen: Tuple[str, str] = ("thin", "solid")  # (thickness, style)
 # Cached screen metrics
 _scr_w, _scr_h = d.get_screen_dim()
 
+# numpy module once looked up by _numpy(); None if it is not installed
+_np = False
+
 # --------------------------- Utilities -----------------------------
 
 def _set_window_state(xmn: Number, xmx: Number, ymn: Number, ymx: Number) -> None:
@@ -69,12 +75,46 @@ def _px_dy_to_world(dy_px: float) -> float:
 
 
 def _is_seq(obj) -> bool:
-    return isinstance(obj, (list, tuple))
+    if isinstance(obj, (list, tuple, array)):
+        return True
+    return getattr(obj, "ndim", 0) > 0  # NumPy arrays (not 0-d ones)
+
+
+def _min_max(seq) -> Tuple[Number, Number]:
+    if getattr(seq, "ndim", 0) > 0:
+        return seq.min().item(), seq.max().item()
+    return min(seq), max(seq)
+
+
+def _numpy():
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = None
+    return _np
+
 
+def _as_arrays(xs, ys):
+    """Float coordinate arrays for the bulk ti_draw calls (NumPy when available)."""
+    np = _numpy()
+    if np is not None:
+        return np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    return array("d", xs), array("d", ys)
 
-def _pairwise(seq: Sequence[Number]):
-    for i in range(len(seq) - 1):
-        yield seq[i], seq[i + 1]
+
+def _shift(seq, delta: float):
+    if isinstance(seq, array):
+        return array("d", [v + delta for v in seq])
+    return seq + delta
+
+
+def _concat(a, b):
+    if isinstance(a, array):
+        return a + b
+    return _numpy().concatenate((a, b))
 
 
 def _with_temp_color(rgb: Tuple[int, int, int]):
@@ -102,57 +142,16 @@ def _with_temp_pen(thickness: str, style: str):
     return _C()
 
 
-def _draw_dashed_or_dotted_line(x1: Number, y1: Number, x2: Number, y2: Number, style: str):
-    """Draw line with pixel-space dash/dot style."""
-    p1x, p1y = _world_to_pixel(x1, y1)
-    p2x, p2y = _world_to_pixel(x2, y2)
-
-    dx = p2x - p1x
-    dy = p2y - p1y
-    length = math.hypot(dx, dy)
-    if length == 0:
-        d.plot_xy(x1, y1)
-        return
-
-    ux, uy = dx / length, dy / length  # unit vector in pixels
-
-    if style == "dotted":
-        step = 5.0
-        r_px = 1.0
-        t = 0.0
-        while t <= length:
-            px = p1x + ux * t
-            py = p1y + uy * t
-            wx, wy = _pixel_to_world(px, py)
-            d.fill_circle(wx, wy, int(r_px))
-            t += step
-    else:  # dashed or default to dashed
-        on = 8.0
-        off = 6.0
-        t = 0.0
-        draw_on = True
-        while t < length:
-            seg = min(on if draw_on else off, length - t)
-            sx = p1x + ux * t
-            sy = p1y + uy * t
-            ex = p1x + ux * (t + seg)
-            ey = p1y + uy * (t + seg)
-            if draw_on:
-                (sxw, syw) = _pixel_to_world(sx, sy)
-                (exw, eyw) = _pixel_to_world(ex, ey)
-                d.draw_line(sxw, exw, syw, eyw)
-            draw_on = not draw_on
-            t += seg
-
-
 def _draw_line_with_style(x1: Number, y1: Number, x2: Number, y2: Number, style: str):
+    """Draw a line; dashes/dots are rasterized by ti_draw from the pen style."""
     style = (style or "solid").lower()
-    if style in ("solid", "default"):
+    if style not in ("dashed", "dotted"):
+        style = "solid"
+    if style == _current_pen[1]:
         d.draw_line(x1, x2, y1, y2)
-    elif style in ("dashed", "dotted"):
-        _draw_dashed_or_dotted_line(x1, y1, x2, y2, style)
     else:
-        d.draw_line(x1, x2, y1, y2)
+        with _with_temp_pen(_current_pen[0], style):
+            d.draw_line(x1, x2, y1, y2)
 
 
 def _draw_arrowhead(x1: Number, y1: Number, x2: Number, y2: Number, size_px: int = 8, angle_deg: float = 28.0):
@@ -195,8 +194,8 @@ def auto_window(x_list: Sequence[Number], y_list: Sequence[Number], pad: float =
     """Auto-fit window to data with ~2% padding (per axis)."""
     if len(x_list) == 0 or len(x_list) != len(y_list):
         raise ValueError("auto_window: x_list and y_list must be non-empty and equal length.")
-    xmn, xmx = min(x_list), max(x_list)
-    ymn, ymx = min(y_list), max(y_list)
+    xmn, xmx = _min_max(x_list)
+    ymn, ymx = _min_max(y_list)
     # Avoid degenerate window
     if xmx == xmn:
         dx = max(1.0, abs(xmx) * 0.1 + 1.0)
@@ -312,8 +311,8 @@ def pen(size: str = "thin", style: str = "solid") -> None:
 def scatter(x_list: Sequence[Number], y_list: Sequence[Number], mark: str = ".") -> None:
     if len(x_list) != len(y_list):
         raise ValueError("scatter: x_list and y_list must have equal length.")
-    for x, y in zip(x_list, y_list):
-        _draw_mark(x, y, mark)
+    if len(x_list):
+        _draw_marks(*_as_arrays(x_list, y_list), mark)
 
 
 def plot(x: Union[Number, Sequence[Number]], y: Union[Number, Sequence[Number]], mark: str = ".") -> None:
@@ -323,14 +322,14 @@ def plot(x: Union[Number, Sequence[Number]], y: Union[Number, Sequence[Number]],
         ys: Sequence[Number] = y  # type: ignore
         if len(xs) != len(ys):
             raise ValueError("plot: x and y sequences must have equal length.")
-        # Connect points
-        line_style = _current_pen[1]
-        for (x1, x2), (y1, y2) in zip(_pairwise(xs), _pairwise(ys)):
-            _draw_line_with_style(x1, y1, x2, y2, line_style)
+        if not len(xs):
+            return
+        xs, ys = _as_arrays(xs, ys)
+        # Connect points (one polyline, in the current pen)
+        d.draw_polyline(xs, ys)
         # Draw marks
         if mark:
-            for xi, yi in zip(xs, ys):
-                _draw_mark(xi, yi, mark)
+            _draw_marks(xs, ys, mark)
     else:
         # Single point
         xi = x if not _is_seq(x) else x[0]  # type: ignore
@@ -415,10 +414,20 @@ def text_at(row: int, text: str, align: str = "left") -> None:
 
 # MARKERS ------------------------------------------------------------
 
+# Pixels of the 3px "+" and "x" marks with a thin solid pen: stamped
+# around the point's pixel, so every mark has the same shape
+_mark_offsets = {
+    "+": [(i, 0) for i in range(-3, 4)] + [(0, i) for i in range(-3, 4) if i],
+    "x": [(i, i) for i in range(-3, 4)] + [(i, -i) for i in range(-3, 4) if i],
+}
+
 def _draw_mark(x: Number, y: Number, mark: str) -> None:
     mark = (mark or ".").lower()
     # Marker sizes in pixels
-    if mark == ".":
+    if mark in _mark_offsets and _current_pen == ("thin", "solid"):
+        dxs, dys = zip(*_mark_offsets[mark])
+        d.stamp_many([x], [y], dxs, dys, 2)
+    elif mark == ".":
         d.fill_circle(x, y, 1)
     elif mark == "o":
         d.fill_circle(x, y, 2)
@@ -437,6 +446,27 @@ def _draw_mark(x: Number, y: Number, mark: str) -> None:
         d.fill_circle(x, y, 2)
 
 
+def _draw_marks(xs, ys, mark: str) -> None:
+    """_draw_mark for every point, as one bulk ti_draw call."""
+    mark = (mark or ".").lower()
+    if mark in _mark_offsets and _current_pen == ("thin", "solid"):
+        dxs, dys = zip(*_mark_offsets[mark])
+        d.stamp_many(xs, ys, dxs, dys, 2)
+    elif mark in ("+", "x"):
+        dxw = _px_dx_to_world(3)
+        dyw = _px_dy_to_world(3)
+        left, right = _shift(xs, -dxw), _shift(xs, dxw)
+        below, above = _shift(ys, -dyw), _shift(ys, dyw)
+        if mark == "+":
+            d.draw_lines_many(_concat(left, xs), _concat(right, xs),
+                              _concat(ys, below), _concat(ys, above))
+        else:
+            d.draw_lines_many(_concat(left, left), _concat(right, right),
+                              _concat(below, above), _concat(above, below))
+    else:
+        d.fill_circles_many(xs, ys, 1 if mark == "." else 2)
+
+
 # Aliases for convenience -------------------------------------------
 # Keep TI-like names if you prefer
 
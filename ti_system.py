@@ -1,43 +1,314 @@
 # ti_system.py
+import os
+import struct
+import threading
 import time
 import sys
+from array import array
+from collections import deque, namedtuple
 
-import pygame
+# pygame is imported and initialized by _init_pygame() the first time a key
+# function needs it, so `import ti_system` (and log.py, fileio.py on top of
+# it) does not pay for pygame at startup.
 
-pygame.init()
-# pygame.display.set_mode((1,1))
 
+_pygame_ready = False
 
-# Internal storage to simulate TI-Nspire's variable store
+
+def _init_pygame():
+    """Import and initialize pygame once; returns the module."""
+    global pygame, _pygame_ready
+    if not _pygame_ready:
+        import pygame
+        pygame.init()
+        # pygame.display.set_mode((1,1))
+        _pygame_ready = True
+    return pygame
+
+
+def __getattr__(name):
+    # `ti_system.pygame` initializes pygame lazily
+    if name == "pygame":
+        return _init_pygame()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Internal storage to simulate TI-Nspire's variable store. With a persistent
+# store open (open_store) this is the read cache in front of the log file.
 _variable_store = {}
 
+# Persistent store: an append-only log of (op, name, value) records. The index
+# maps each name to the offset/length of its latest value on disk; values are
+# read on first recall. Stores only mark names dirty; flush_store() appends
+# them in one write once _flush_batch names or _flush_interval seconds pile up.
+_STORE_MAGIC = b"TIVS\x01"
+_STORE_RECORD = struct.Struct("<BHI")  # op, name length, value length
+_STORE_SET, _STORE_DEL = 1, 2
+_store_file = None
+_store_path = os.environ.get("TI_SYSTEM_STORE")  # opened on first store access
+_store_end = 0
+_store_index = {}
+_store_dirty = set()
+_store_garbage = 0  # bytes held by superseded records
+_store_lock = threading.RLock()
+_store_compactor = None
+_store_atexit = False
+_flush_batch = 64
+_flush_interval = 1.0
+_last_flush = 0.0
+
+# Snapshot images (snapshot/restore): header, an index of
+# (name, offset, length) entries, then the encoded values. A lazy restore
+# keeps the image mapped and decodes a value on its first recall.
+_SNAPSHOT_MAGIC = b"TISN\x01"
+_SNAPSHOT_ENTRY = struct.Struct("<QI")  # offset, length
+_snapshot_index = {}
+_snapshot_map = None
+
+# Calculator memory model: bytes a variable would take on the handheld,
+# approximated as a name overhead plus a fixed size per number, per list or
+# string header and per character. Adjust _ti_sizes to match a device.
+# _memory_quota (None: unlimited) makes stores that would exceed it raise
+# MemoryError; _memory_growth keeps (time_ms, byte delta) of recent stores.
+# _ti_usage holds the size of every variable, loaded or not, and _ti_used
+# their sum: kept up to date by stores, rebuilt when a store or image opens.
+_ti_sizes = {"name": 8, "number": 9, "list": 2, "string": 2, "function": 64}
+_ti_usage = {}
+_ti_used = 0
+_memory_quota = None
+_memory_growth = deque(maxlen=1024)
+
+# Call counts of the calculator API while start_profiling() is on, else None
+_profile = None
+_profile_last = {}  # counts kept by stop_profiling()
+
 # Record boot time to simulate system clock behavior
 _boot_time = time.time()
 
+# Clock behind get_time_ms (set_clock):
+#   "real"    - wall time since _boot_time
+#   "virtual" - _clock_base_ms, moved only by advance_time() and sleep()
+#   "scaled"  - _clock_base_ms plus monotonic time since _clock_anchor * scale
+_clock_modes = ("real", "virtual", "scaled")
+_clock_mode = "real"
+_clock_scale = 1.0
+_clock_base_ms = 0.0
+_clock_anchor = 0.0
+
+
+def _lookup(name):
+    if name in _variable_store:
+        return _variable_store[name]
+    if name in _snapshot_index:
+        return _load_snapshot(name)
+    if _store_path is not None:
+        _ensure_store()
+        if name in _store_index:
+            return _load(name)
+    return None
+
+
+def _stored(name):
+    if _store_path is not None:
+        _ensure_store()
+        # the background compactor writes and clears the dirty set under the lock
+        with _store_lock:
+            _store_dirty.add(name)
+            if len(_store_dirty) >= _flush_batch or time.monotonic() - _last_flush >= _flush_interval:
+                flush_store()
+
 
 def recall_value(name: str):
     """Recalls the value of a variable stored in TI-Nspire."""
-    return _variable_store.get(name)
+    if _profile is not None:
+        _profile_count("recall_value")
+    return _lookup(name)
 
 
 def store_value(name: str, value):
     """Stores the value into TI-Nspire's variable store."""
+    if _profile is not None:
+        _profile_count("store_value")
+    _account(name, value)
     _variable_store[name] = value
+    _stored(name)
+
+
+def _to_array(_list):
+    """Pack numbers into array('q') (all ints) or array('d'); the array
+    constructor does the type check. None if an int does not fit in 64 bits,
+    since array('d') would round it."""
+    if isinstance(_list, array):
+        code = "d" if _list.typecode in "fd" else "q"
+        return _list if _list.typecode == code else array(code, _list)
+    try:
+        return array("q", _list)
+    except (TypeError, OverflowError):
+        if any(isinstance(x, int) and not -2**63 <= x < 2**63 for x in _list):
+            return None
+        return array("d", _list)
 
 
 def recall_list(name: str):
     """Recalls a list[int|float] from TI-Nspire's variable store."""
-    val = _variable_store.get(name)
+    if _profile is not None:
+        _profile_count("recall_list")
+    val = _lookup(name)
+    if isinstance(val, array):
+        return val.tolist()
+    # lists put in with store_value are checked on every recall
     if isinstance(val, list) and all(isinstance(x, (int, float)) for x in val):
         return val
     raise TypeError(f"Variable '{name}' is not a list of int/float")
 
 
+def recall_array(name: str, copy: bool = False):
+    """
+    Recall a stored list without converting it (PC only): a read-only
+    memoryview of the stored array('q'/'d'), or a new array if copy=True.
+    """
+    val = _lookup(name)
+    if not isinstance(val, array):
+        if not isinstance(val, list):
+            raise TypeError(f"Variable '{name}' is not a list of int/float")
+        packed = _to_array(recall_list(name))
+        if packed is None:
+            raise OverflowError(f"Variable '{name}' has ints too large for an array")
+        return packed
+    return array(val.typecode, val) if copy else memoryview(val).toreadonly()
+
+
 def store_list(name: str, _list):
     """Stores a list[int|float] into TI-Nspire's variable store."""
-    if not isinstance(_list, list) or not all(isinstance(x, (int, float)) for x in _list):
+    if _profile is not None:
+        _profile_count("store_list")
+    if not isinstance(_list, (list, array)):
         raise TypeError("_list must be a list of int or float")
-    _variable_store[name] = _list
+    try:
+        packed = _to_array(_list)
+    except (TypeError, OverflowError):
+        raise TypeError("_list must be a list of int or float") from None
+    if packed is None:
+        # ints past int64 stay a plain list so they round-trip exactly
+        if not all(isinstance(x, (int, float)) for x in _list):
+            raise TypeError("_list must be a list of int or float")
+        packed = list(_list)
+    _account(name, packed)
+    # never keep the caller's array: later changes to it must not leak in
+    _variable_store[name] = packed if packed is not _list else array(packed.typecode, packed)
+    _stored(name)
+
+
+def get_memory_usage() -> dict:
+    """
+    Bytes used by each loaded variable in this process. Variables not yet
+    read from the persistent store are left out.
+    """
+    usage = {}
+    for name, val in _variable_store.items():
+        size = sys.getsizeof(val)
+        if isinstance(val, list):
+            size += sum(sys.getsizeof(x) for x in val)
+        usage[name] = size
+    return usage
+
+
+def _ti_size(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return _ti_sizes["number"]
+    if isinstance(value, str):
+        return _ti_sizes["string"] + len(value.encode("utf-8"))
+    if isinstance(value, array):
+        return _ti_sizes["list"] + _ti_sizes["number"] * len(value)
+    if isinstance(value, (list, tuple)):
+        return _ti_sizes["list"] + sum(_ti_size(x) for x in value)
+    if callable(value):
+        return _ti_sizes["function"]
+    return _ti_sizes["number"]
+
+
+def _encoded_ti_size(buf, offset, length) -> int:
+    """_ti_size of a value still encoded in the log or a snapshot."""
+    tag = buf[offset:offset + 1]
+    n = length - 1
+    if tag in (b"Q", b"A", b"q", b"D"):
+        return _ti_sizes["list"] + _ti_sizes["number"] * (n // 8)
+    if tag == b"s":
+        return _ti_sizes["string"] + n
+    if tag == b"L":  # walk the element headers, elements can be strings or lists
+        size = _ti_sizes["list"]
+        pos, end = offset + 1, offset + length
+        while pos < end:
+            (k,) = struct.unpack_from("<I", buf, pos)
+            size += _encoded_ti_size(buf, pos + 4, k)
+            pos += 4 + k
+        return size
+    return 0 if tag == b"N" else _ti_sizes["number"]
+
+
+def _recount_memory():
+    """Rebuild _ti_usage from every variable, including ones not loaded yet."""
+    import mmap
+    global _ti_usage, _ti_used
+    name_size = _ti_sizes["name"]
+    sizes = {name: name_size + len(name) + _ti_size(v) for name, v in _variable_store.items()}
+    for name, (offset, length) in _snapshot_index.items():
+        if name not in sizes:
+            sizes[name] = name_size + len(name) + _encoded_ti_size(_snapshot_map, offset, length)
+    if _store_file is not None:
+        with _store_lock:
+            _store_file.flush()
+            with mmap.mmap(_store_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for name, (offset, length, _) in _store_index.items():
+                    if name not in sizes:
+                        sizes[name] = name_size + len(name) + _encoded_ti_size(mm, offset, length)
+    _ti_usage = sizes
+    _ti_used = sum(sizes.values())
+
+
+def _account(name, value):
+    """Check the quota for storing `value`, then record its size and the growth."""
+    global _ti_used
+    new = _ti_sizes["name"] + len(name) + _ti_size(value)
+    old = _ti_usage.get(name, 0)
+    if _memory_quota is not None and _ti_used - old + new > _memory_quota:
+        raise MemoryError(f"Memory: storing '{name}' needs {new} bytes, "
+                          f"{_memory_quota - _ti_used + old} free")
+    _ti_usage[name] = new
+    _ti_used += new - old
+    _memory_growth.append((get_time_ms(), new - old))
+
+
+def set_memory_quota(quota):
+    """Limit the store to `quota` calculator bytes (None: no limit), PC only."""
+    global _memory_quota
+    if quota is not None and quota < 0:
+        raise ValueError("quota must be positive or None")
+    _memory_quota = quota
+
+
+def get_memory_report(top: int = 5) -> dict:
+    """
+    Calculator-style usage of the store: total, quota, free, variable count,
+    the `top` largest variables as (name, bytes) and growth_bytes_per_s
+    over the recent stores.
+    """
+    total = _ti_used
+    largest = sorted(_ti_usage.items(), key=lambda item: -item[1])[:top]
+    growth = 0.0
+    if _memory_growth:
+        span = get_time_ms() - _memory_growth[0][0]
+        if span > 0:
+            growth = sum(d for _, d in _memory_growth) * 1000 / span
+    return {"total": total, "quota": _memory_quota,
+            "free": None if _memory_quota is None else _memory_quota - total,
+            "variables": len(_ti_usage), "largest": largest, "growth_bytes_per_s": growth}
+
+
+def reset_memory_growth():
+    _memory_growth.clear()
 
 
 def eval_function(name: str, value):
@@ -45,12 +316,453 @@ def eval_function(name: str, value):
     Calls a TI-Nspire function of one variable.
     Here we simulate this by looking for a Python callable stored under `name`.
     """
-    func = _variable_store.get(name)
+    if _profile is not None:
+        _profile_count("eval_function")
+    func = _lookup(name)
     if callable(func):
         return func(value)
     raise ValueError(f"No callable function stored under '{name}'")
 
 
+def eval_function_many(name: str, values):
+    """
+    eval_function over a sequence (PC only). A NumPy array is first passed
+    to the function whole, which works for functions written with NumPy
+    operations; if that fails or gives the wrong shape, each value is
+    evaluated on its own. Returns a NumPy array for NumPy input, else a list.
+    """
+    func = _lookup(name)
+    if not callable(func):
+        raise ValueError(f"No callable function stored under '{name}'")
+    if _profile is not None:
+        # one call per value on the device
+        _profile_count("eval_function", len(values) if hasattr(values, "__len__") else 1)
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(values, np.ndarray):
+        try:
+            # memoized functions can't hash arrays: call the original
+            result = getattr(func, "__wrapped__", func)(values)
+            if isinstance(result, np.ndarray) and result.shape == values.shape:
+                return result
+        except (TypeError, ValueError):
+            pass
+        return np.array([func(v) for v in values.tolist()])
+    return list(map(func, values))
+
+
+def memoize_function(name: str, maxsize: int = 256):
+    """
+    Cache results of the deterministic function stored under `name` in an
+    LRU of `maxsize` entries (PC only). maxsize=0 removes the cache.
+    """
+    import functools
+    func = _lookup(name)
+    if not callable(func):
+        raise ValueError(f"No callable function stored under '{name}'")
+    func = getattr(func, "__wrapped__", func)
+    _variable_store[name] = functools.lru_cache(maxsize)(func) if maxsize else func
+
+
+def get_function_cache_stats(name: str) -> dict:
+    """hits, misses, maxsize and currsize of a memoized function."""
+    func = _lookup(name)
+    if not hasattr(func, "cache_info"):
+        raise ValueError(f"Function '{name}' is not memoized")
+    return func.cache_info()._asdict()
+
+
+# ---- Persistent store (PC only) ----
+# Value encoding: one tag byte, then
+#   N None, T/F bool, i int64, I big int as text, d float64, s utf-8 text,
+#   q list of int64, D list of float64, L list of encoded values (u32 lengths)
+#   Q array('q'), A array('d') (store_list), little-endian
+# Values that cannot be encoded (functions) stay in memory only.
+
+def _encode_value(value):
+    if isinstance(value, array):
+        if sys.byteorder == "big":
+            value = array(value.typecode, value)
+            value.byteswap()
+        return (b"Q" if value.typecode == "q" else b"A") + value.tobytes()
+    if value is None:
+        return b"N"
+    if value is True or value is False:
+        return b"T" if value else b"F"
+    if isinstance(value, int):
+        if -2**63 <= value < 2**63:
+            return b"i" + struct.pack("<q", value)
+        return b"I" + str(value).encode()
+    if isinstance(value, float):
+        return b"d" + struct.pack("<d", value)
+    if isinstance(value, str):
+        return b"s" + value.encode("utf-8")
+    if isinstance(value, list):
+        if all(type(x) is int and -2**63 <= x < 2**63 for x in value):
+            return b"q" + struct.pack(f"<{len(value)}q", *value)
+        if all(type(x) is float for x in value):
+            return b"D" + struct.pack(f"<{len(value)}d", *value)
+        parts = [b"L"]
+        for x in value:
+            data = _encode_value(x)
+            if data is None:
+                return None
+            parts.append(struct.pack("<I", len(data)))
+            parts.append(data)
+        return b"".join(parts)
+    return None
+
+def _decode_value(data):
+    tag, body = data[:1], data[1:]
+    if tag == b"N":
+        return None
+    if tag in (b"T", b"F"):
+        return tag == b"T"
+    if tag == b"i":
+        return struct.unpack("<q", body)[0]
+    if tag == b"I":
+        return int(body)
+    if tag == b"d":
+        return struct.unpack("<d", body)[0]
+    if tag == b"s":
+        return bytes(body).decode("utf-8")
+    if tag == b"q":
+        return list(struct.unpack(f"<{len(body) // 8}q", body))
+    if tag == b"D":
+        return list(struct.unpack(f"<{len(body) // 8}d", body))
+    if tag in (b"Q", b"A"):
+        arr = array("q" if tag == b"Q" else "d")
+        arr.frombytes(body)
+        if sys.byteorder == "big":
+            arr.byteswap()
+        return arr
+    if tag == b"L":
+        out = []
+        pos = 0
+        while pos < len(body):
+            (n,) = struct.unpack_from("<I", body, pos)
+            out.append(_decode_value(body[pos + 4:pos + 4 + n]))
+            pos += 4 + n
+        return out
+    raise ValueError(f"Unknown value tag {tag!r} in store")
+
+def _scan_store(f):
+    """Index the log by walking record headers only; drop a torn tail."""
+    import mmap
+    global _store_end, _store_garbage
+    index = {}
+    garbage = 0
+    size = os.fstat(f.fileno()).st_size
+    pos = len(_STORE_MAGIC)
+    if size > pos:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:pos] != _STORE_MAGIC:
+                raise ValueError(f"{_store_path} is not a ti_system store")
+            hdr = _STORE_RECORD.size
+            while pos + hdr <= size:
+                op, klen, vlen = _STORE_RECORD.unpack_from(mm, pos)
+                end = pos + hdr + klen + vlen
+                if end > size or op not in (_STORE_SET, _STORE_DEL):
+                    break
+                name = mm[pos + hdr:pos + hdr + klen].decode("utf-8")
+                old = index.pop(name, None)
+                if old is not None:
+                    garbage += old[2]
+                if op == _STORE_SET:
+                    index[name] = (pos + hdr + klen, vlen, end - pos)
+                else:
+                    garbage += end - pos
+                pos = end
+    if pos != size:
+        f.truncate(pos)  # interrupted write
+    _store_end = pos
+    _store_garbage = garbage
+    return index
+
+def _ensure_store():
+    global _store_file, _store_index, _last_flush, _store_atexit
+    if _store_file is not None:
+        return
+    with _store_lock:
+        if _store_file is not None:
+            return
+        import atexit
+        exists = os.path.exists(_store_path)
+        f = open(_store_path, "r+b" if exists else "w+b")
+        if not exists or os.fstat(f.fileno()).st_size == 0:
+            f.write(_STORE_MAGIC)
+            f.flush()
+        _store_index = _scan_store(f)
+        _store_file = f
+        _last_flush = time.monotonic()
+        # values stored (or restored) before the log was opened are newer than the log
+        for name in list(_snapshot_index):
+            _load_snapshot(name)
+        _store_dirty.update(_variable_store)
+        _recount_memory()
+        if not _store_atexit:
+            atexit.register(close_store)
+            _store_atexit = True
+
+def _load(name):
+    with _store_lock:
+        offset, length, _ = _store_index[name]
+        _store_file.seek(offset)
+        value = _decode_value(_store_file.read(length))
+    _variable_store[name] = value
+    return value
+
+def open_store(path: str):
+    """
+    Keep the variable store in the log file at `path` (created if missing).
+    Only the record headers are read now; values load on first recall.
+    Setting TI_SYSTEM_STORE does the same on first store access.
+    """
+    global _store_path
+    close_store()
+    _store_path = path
+    _ensure_store()
+
+def flush_store():
+    """Append every value stored since the last flush to the log."""
+    if _store_file is None:
+        return
+    with _store_lock:
+        _write_dirty()
+        if _store_garbage > 65536 and _store_garbage > _store_end // 2:
+            _compact_in_background()
+
+def _write_dirty():
+    global _store_end, _store_garbage, _last_flush
+    chunks = []
+    pos = _store_end
+    for name in _store_dirty:
+        key = name.encode("utf-8")
+        data = _encode_value(_variable_store[name]) if name in _variable_store else None
+        old = _store_index.pop(name, None)
+        if old is not None:
+            _store_garbage += old[2]
+        if data is None:  # removed or not persistable: drop what the log has
+            if old is None:
+                continue
+            op, data = _STORE_DEL, b""
+        else:
+            op = _STORE_SET
+        record = _STORE_RECORD.pack(op, len(key), len(data)) + key + data
+        if op == _STORE_SET:
+            _store_index[name] = (pos + _STORE_RECORD.size + len(key), len(data), len(record))
+        else:
+            _store_garbage += len(record)
+        chunks.append(record)
+        pos += len(record)
+    _store_dirty.clear()
+    if chunks:
+        _store_file.seek(_store_end)
+        _store_file.write(b"".join(chunks))
+        _store_file.flush()
+        _store_end = pos
+    _last_flush = time.monotonic()
+
+def compact_store():
+    """
+    Rewrite the log with only the latest record of each variable. The copy
+    runs without the lock: records below the current end never change, and
+    whatever is appended meanwhile is carried over at the end.
+    """
+    global _store_file, _store_index, _store_end, _store_garbage
+    with _store_lock:
+        if _store_file is None:
+            return
+        _write_dirty()
+        path, end = _store_path, _store_end
+        live = list(_store_index.items())
+    tmp = path + ".compact"
+    copied = _copy_records(path, tmp, live)
+    with _store_lock:
+        if _store_file is None or _store_path != path:  # closed meanwhile
+            os.remove(tmp)
+            return
+        _write_dirty()
+        _store_file.seek(end)
+        tail = _store_file.read(_store_end - end)
+        pos = os.path.getsize(tmp)
+        index = {}
+        for name, (offset, length, size) in _store_index.items():
+            if offset < end:
+                index[name] = copied[name]
+            else:  # rewritten or added during the copy
+                index[name] = (offset - end + pos, length, size)
+        with open(tmp, "ab") as out:
+            out.write(tail)
+        _store_file.close()
+        os.replace(tmp, path)
+        _store_file = open(path, "r+b")
+        _store_index = index
+        _store_end = pos + len(tail)
+        _store_garbage = _store_end - len(_STORE_MAGIC) - sum(e[2] for e in index.values())
+
+def _copy_records(path, tmp, live):
+    """Write the `live` records of the log at `path` to a new log `tmp`."""
+    index = {}
+    with open(path, "rb") as src, open(tmp, "wb") as out:
+        out.write(_STORE_MAGIC)
+        pos = len(_STORE_MAGIC)
+        for name, (offset, length, size) in live:
+            src.seek(offset - (size - length))
+            out.write(src.read(size))
+            index[name] = (pos + size - length, length, size)
+            pos += size
+    return index
+
+def _compact_in_background():
+    global _store_compactor
+    if _store_compactor is not None and _store_compactor.is_alive():
+        return
+    _store_compactor = threading.Thread(target=compact_store, name="ti_system-compact", daemon=True)
+    _store_compactor.start()
+
+def close_store():
+    """Flush and close the persistent store. Loaded values stay in memory."""
+    global _store_file, _store_path
+    if _store_compactor is not None:
+        _store_compactor.join()
+    if _store_file is None:
+        _store_path = None
+        return
+    with _store_lock:
+        _write_dirty()  # not flush_store: that could start a compactor on a closing log
+        _store_file.close()
+        _store_file = None
+        _store_index.clear()
+        _store_path = None
+        _recount_memory()  # unloaded variables went with the log
+
+def get_store_stats() -> dict:
+    """Log size, bytes of superseded records, indexed and unflushed names."""
+    return {"path": _store_path, "bytes": _store_end, "garbage": _store_garbage,
+            "variables": len(_store_index), "dirty": len(_store_dirty)}
+
+
+# ---- Snapshots (PC only) ----
+
+def snapshot(path: str) -> int:
+    """
+    Write every variable to a binary image at `path`; returns how many were
+    written. Functions can't be encoded and are skipped. Variables of an open
+    persistent store that were never recalled are copied from the log as is.
+    """
+    names, blobs = [], []
+    for name in list(_variable_store) + [n for n in _snapshot_index if n not in _variable_store]:
+        data = _encode_value(_lookup(name))
+        if data is not None:
+            names.append(name.encode("utf-8"))
+            blobs.append(data)
+    if _store_path is not None:
+        _ensure_store()
+        with _store_lock:
+            flush_store()  # so the index has no deleted or superseded values
+            for name, (offset, length, _) in _store_index.items():
+                if name not in _variable_store and name not in _snapshot_index:
+                    _store_file.seek(offset)
+                    names.append(name.encode("utf-8"))
+                    blobs.append(_store_file.read(length))
+    index_size = 4 + sum(2 + len(k) + _SNAPSHOT_ENTRY.size for k in names)
+    offset = len(_SNAPSHOT_MAGIC) + index_size
+    parts = [_SNAPSHOT_MAGIC, struct.pack("<I", len(names))]
+    for key, data in zip(names, blobs):
+        parts.append(struct.pack("<H", len(key)) + key + _SNAPSHOT_ENTRY.pack(offset, len(data)))
+        offset += len(data)
+    parts.extend(blobs)
+    with open(path + ".tmp", "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(path + ".tmp", path)
+    return len(names)
+
+def _load_snapshot(name):
+    global _snapshot_map
+    offset, length = _snapshot_index.pop(name)
+    value = _decode_value(_snapshot_map[offset:offset + length])
+    _variable_store[name] = value
+    if not _snapshot_index:
+        _snapshot_map.close()
+        _snapshot_map = None
+    return value
+
+def restore(path: str, lazy: bool = True) -> int:
+    """
+    Replace the variable store with the image written by snapshot().
+    Only the index is read; with lazy=True each value is decoded from the
+    memory-mapped image on its first recall. Returns the variable count.
+    With a persistent store open everything is loaded and written through.
+    """
+    import mmap
+    global _snapshot_map
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+        mm.close()
+        raise ValueError(f"{path} is not a ti_system snapshot")
+    index = {}
+    pos = len(_SNAPSHOT_MAGIC)
+    (count,) = struct.unpack_from("<I", mm, pos)
+    pos += 4
+    for _ in range(count):
+        (klen,) = struct.unpack_from("<H", mm, pos)
+        name = mm[pos + 2:pos + 2 + klen].decode("utf-8")
+        index[name] = _SNAPSHOT_ENTRY.unpack_from(mm, pos + 2 + klen)
+        pos += 2 + klen + _SNAPSHOT_ENTRY.size
+    if _snapshot_map is not None:
+        _snapshot_map.close()
+    _snapshot_map = mm if index else None
+    if not index:
+        mm.close()
+    _snapshot_index.clear()
+    _snapshot_index.update(index)
+    _variable_store.clear()
+    if _store_path is not None:
+        _ensure_store()
+        lazy = False
+        with _store_lock:
+            _store_dirty.update(_store_index)  # names missing from the image are dropped
+    if not lazy:
+        for name in list(_snapshot_index):
+            _load_snapshot(name)
+    if _store_path is not None:
+        with _store_lock:
+            _store_dirty.update(index)
+            flush_store()
+    _recount_memory()
+    return count
+
+
+# ---- Profiling (PC only) ----
+
+def _profile_count(name, n=1):
+    _profile[name] = _profile.get(name, 0) + n
+
+def start_profiling():
+    """Count calls to the calculator API (store/recall, eval_function, get_key)."""
+    global _profile
+    if _profile is None:
+        _profile = {}
+
+def stop_profiling():
+    """Stop counting; get_profile() keeps the counts until reset_profile()."""
+    global _profile, _profile_last
+    if _profile is not None:
+        _profile_last = _profile
+    _profile = None
+
+def get_profile() -> dict:
+    """{function name: calls} counted so far."""
+    return dict(_profile if _profile is not None else _profile_last)
+
+def reset_profile():
+    global _profile_last
+    _profile_last = {}
+    if _profile is not None:
+        _profile.clear()
+
+
 def get_platform():
     """Returns 'hh' to indicate handheld."""
     return "hh"
@@ -78,131 +790,411 @@ def get_time_ms():
     Returns the current system clock (milliseconds since boot).
     Boot time is when this module was first imported.
     """
-    return int((time.time() - _boot_time) * 1000)
-
-# Map pygame keys to TI key names
-_keymap = {
-    pygame.K_UP: "up",
-    pygame.K_DOWN: "down",
-    pygame.K_LEFT: "left",
-    pygame.K_RIGHT: "right",
-    pygame.K_RETURN: "enter",
-    pygame.K_ESCAPE: "esc",
-    pygame.K_SPACE: " ",
-    pygame.K_BACKSPACE: "del",
-    pygame.K_a: "a",
-    pygame.K_b: "b",
-    pygame.K_c: "c",
-    pygame.K_d: "d",
-    pygame.K_e: "e",
-    pygame.K_f: "f",
-    pygame.K_g: "g",
-    pygame.K_h: "h",
-    pygame.K_i: "i",
-    pygame.K_j: "j",
-    pygame.K_k: "k",
-    pygame.K_l: "l",
-    pygame.K_m: "m",
-    pygame.K_n: "n",
-    pygame.K_o: "o",
-    pygame.K_p: "p",
-    pygame.K_q: "q",
-    pygame.K_r: "r",
-    pygame.K_s: "s",
-    pygame.K_t: "t",
-    pygame.K_u: "u",
-    pygame.K_v: "v",
-    pygame.K_w: "w",
-    pygame.K_x: "x",
-    pygame.K_y: "y",
-    pygame.K_z: "z",
-    pygame.K_0: "0",
-    pygame.K_1: "1",
-    pygame.K_2: "2",
-    pygame.K_3: "3",
-    pygame.K_4: "4",
-    pygame.K_5: "5",
-    pygame.K_6: "6",
-    pygame.K_7: "7",
-    pygame.K_8: "8",
-    pygame.K_9: "9",
+    return int(_clock_ms())
+
+
+def _clock_ms() -> float:
+    if _clock_mode == "real":
+        return (time.time() - _boot_time) * 1000
+    if _clock_mode == "virtual":
+        return _clock_base_ms
+    return _clock_base_ms + (time.monotonic() - _clock_anchor) * 1000 * _clock_scale
+
+
+def set_clock(mode: str, scale: float = 1.0):
+    """
+    Choose the clock behind get_time_ms (PC only): "real", "virtual"
+    (advanced by advance_time/sleep, so simulations run as fast as the CPU
+    allows and repeat exactly) or "scaled" (real time times `scale`).
+    The clock continues from its current reading.
+    """
+    global _clock_mode, _clock_scale, _clock_base_ms, _clock_anchor, _boot_time
+    if mode not in _clock_modes:
+        raise ValueError(f"Unknown clock '{mode}', expected one of {_clock_modes}")
+    if scale <= 0:
+        raise ValueError("scale must be positive")
+    now = _clock_ms()
+    if mode == "real":
+        _boot_time = time.time() - now / 1000
+    _clock_base_ms = now
+    _clock_anchor = time.monotonic()
+    _clock_mode = mode
+    _clock_scale = scale if mode == "scaled" else 1.0
 
-}
 
+def get_clock() -> tuple:
+    """(mode, scale) of the current clock."""
+    return _clock_mode, _clock_scale
+
+
+def advance_time(ms: float):
+    """Move the virtual clock forward by `ms` milliseconds."""
+    global _clock_base_ms
+    if _clock_mode != "virtual":
+        raise ValueError("advance_time needs the virtual clock (set_clock('virtual'))")
+    if ms < 0:
+        raise ValueError("time can't go backwards")
+    _clock_base_ms += ms
+
+
+def clock_seconds() -> float:
+    """The current clock in seconds, for ti_draw.set_frame_clock."""
+    return _clock_ms() / 1000
+
+
+def sleep(seconds: float):
+    """time.sleep on the current clock: virtual time just advances."""
+    if _clock_mode == "virtual":
+        advance_time(seconds * 1000)
+    elif seconds > 0:
+        time.sleep(seconds / _clock_scale)
+
+# Map pygame keys to TI key names, built by _get_keymap() on first use
+_keymap = None
+
+def _get_keymap():
+    global _keymap
+    if _keymap is None:
+        pg = _init_pygame()
+        keymap = {
+            pg.K_UP: "up",
+            pg.K_DOWN: "down",
+            pg.K_LEFT: "left",
+            pg.K_RIGHT: "right",
+            pg.K_RETURN: "enter",
+            pg.K_ESCAPE: "esc",
+            pg.K_SPACE: " ",
+            pg.K_BACKSPACE: "del",
+        }
+        for ch in "abcdefghijklmnopqrstuvwxyz0123456789":
+            keymap[getattr(pg, "K_" + ch)] = ch
+        _keymap = keymap
+    return _keymap
+
+# Every mapped KEYDOWN, oldest first. A bounded ring: when full, the oldest
+# event is dropped and counted. _last_key mirrors the newest queued key for
+# code that still reads it directly.
+KeyEvent = namedtuple("KeyEvent", "key time_ms mods")
+_key_queue = deque(maxlen=256)
+_key_stats = {"pushed": 0, "dropped": 0, "max_depth": 0}
 _last_key = None
 
+def _push_key(key, mods=0):
+    global _last_key
+    if len(_key_queue) == _key_queue.maxlen:
+        _key_stats["dropped"] += 1
+    _key_queue.append(KeyEvent(key, get_time_ms(), mods))
+    _key_stats["pushed"] += 1
+    if len(_key_queue) > _key_stats["max_depth"]:
+        _key_stats["max_depth"] = len(_key_queue)
+    _last_key = key
+
+def _pop_key():
+    """Oldest queued key, or None."""
+    global _last_key
+    if not _key_queue:
+        k, _last_key = _last_key, None  # set directly, not via the queue
+        return k
+    k = _key_queue.popleft().key
+    if not _key_queue:
+        _last_key = None
+    return k
+
+def _handle_event(pg, keymap, event):
+    if event.type == pg.QUIT:
+        pg.quit()
+        raise SystemExit
+    elif event.type == pg.KEYDOWN:
+        if event.key in keymap:
+            _push_key(keymap[event.key], getattr(event, "mod", 0))
+
 def poll_events():
     """Polls pygame events and updates _last_key (called from ti_draw.update)."""
-    global _last_key
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            raise SystemExit
-        elif event.type == pygame.KEYDOWN:
-            if event.key in _keymap:
-                _last_key = _keymap[event.key]
+    pg = _init_pygame()
+    keymap = _get_keymap()
+    for event in pg.event.get():
+        _handle_event(pg, keymap, event)
 
-def _get_key_from_stdin() -> str:
-    # Pygame not initialized → fallback to terminal input
-    if sys.platform == "win32":
-        import msvcrt
-        if msvcrt.kbhit():
-            ch = msvcrt.getch()
-            # decode byte to string
-            try:
-                return ch.decode("utf-8")
-            except:
-                return ""
-        else:
-            return ""
-    else:
-        # Unix fallback
-        import tty, termios
-        import select
-        fd = sys.stdin.fileno()
-        old_settings = termios.tcgetattr(fd)
+# Terminal input when there is no pygame window. Escape sequences and control
+# bytes are decoded to the same TI key names as _keymap; anything else is
+# returned as the character typed.
+_escape_keys = {
+    b"\x1b[A": "up", b"\x1b[B": "down", b"\x1b[C": "right", b"\x1b[D": "left",
+    b"\x1bOA": "up", b"\x1bOB": "down", b"\x1bOC": "right", b"\x1bOD": "left",
+    b"\x1b[3~": "del",
+}
+_byte_keys = {b"\n": "enter", b"\r": "enter", b"\x7f": "del", b"\x08": "del", b"\x1b": "esc"}
+# Windows console: getch() returns b"\x00" or b"\xe0" followed by a scan code
+_console_keys = {b"H": "up", b"P": "down", b"K": "left", b"M": "right", b"S": "del"}
+
+def _escape_end(buf, i):
+    """
+    End of the escape sequence at buf[i]: a CSI (ESC [, parameter and
+    intermediate bytes, one final byte in 0x40-0x7E) or an SS3 (ESC O and
+    one byte). i + 1 for a lone ESC, None if the sequence is still incomplete.
+    """
+    kind = buf[i + 1:i + 2]
+    if kind == b"O":
+        return i + 3 if i + 2 < len(buf) else None
+    if kind != b"[":
+        return i + 1
+    j = i + 2
+    while j < len(buf) and 0x20 <= buf[j] <= 0x3F:
+        j += 1
+    if j == len(buf):
+        return None
+    return j + 1 if 0x40 <= buf[j] <= 0x7E else j  # malformed: drop up to the stray byte
+
+
+class _StdinReader:
+    """
+    Reads keys from a terminal fd. cbreak mode is entered once, on creation,
+    and restored at exit; reads go through a selector so polling is one
+    select() call when nothing was typed. Regular files and /dev/null cannot
+    be registered with epoll; they never block, so they are read directly.
+    """
+    def __init__(self, fd):
+        import atexit, codecs, selectors, termios, tty
+        self.fd = fd
+        self.old_settings = None
         try:
+            self.old_settings = termios.tcgetattr(fd)
             tty.setcbreak(fd)
-            dr, _, _ = select.select([sys.stdin], [], [], 0)
-            if dr:
-                ch = sys.stdin.read(1)
-                return ch
+        except termios.error:  # not a terminal (pipe, file): nothing to set
+            pass
+        self.selector = selectors.DefaultSelector()
+        try:
+            self.selector.register(fd, selectors.EVENT_READ)
+        except (OSError, ValueError):  # EPERM: a file, always readable
+            self.selector.close()
+            self.selector = None
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.pending = b""
+        self.eof = False
+        atexit.register(self.restore)
+
+    def restore(self):
+        if self.old_settings is not None:
+            import termios
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.old_settings)
+            self.old_settings = None
+
+    def read(self, timeout=0) -> bool:
+        """
+        Wait up to `timeout` seconds (None: forever) for input and queue the
+        decoded keys. Returns False if nothing could be read.
+        """
+        if self.eof:
+            return False
+        if self.selector is not None and not self.selector.select(timeout):
+            return False
+        data = os.read(self.fd, 1024)
+        if not data:
+            self.eof = True
+            return False
+        self.pending += data
+        self._decode()
+        return True
+
+    def _decode(self):
+        buf = self.pending
+        i, n = 0, len(buf)
+        while i < n:
+            if buf[i:i + 1] == b"\x1b" and i + 1 < n:
+                end = _escape_end(buf, i)
+                if end is None:
+                    break  # sequence split across reads; finish it next time
+                if end == i + 1:
+                    _push_key("esc")
+                elif buf[i:end] in _escape_keys:
+                    _push_key(_escape_keys[buf[i:end]])
+                # other keys (Home, F1, Ctrl+arrows...) have no TI key: drop them
+                i = end
+                continue
+            b = buf[i:i + 1]
+            i += 1
+            if b in _byte_keys:
+                _push_key(_byte_keys[b])
             else:
+                ch = self.decoder.decode(b)
+                if ch:
+                    _push_key(ch)
+        self.pending = buf[i:]
+
+_stdin_reader = None
+
+def _read_console_keys():
+    import msvcrt
+    while msvcrt.kbhit():
+        ch = msvcrt.getch()
+        if ch in (b"\x00", b"\xe0"):
+            key = _console_keys.get(msvcrt.getch())
+            if key is not None:
+                _push_key(key)
+        elif ch in _byte_keys:
+            _push_key(_byte_keys[ch])
+        else:
+            try:
+                _push_key(ch.decode("utf-8"))
+            except UnicodeDecodeError:
+                pass
+
+def _read_stdin_keys(timeout=0) -> bool:
+    """Queue keys typed on stdin, waiting up to `timeout` seconds for some."""
+    global _stdin_reader
+    if sys.platform == "win32":
+        _read_console_keys()
+        return bool(_key_queue)
+    if _stdin_reader is None:
+        _stdin_reader = _StdinReader(sys.stdin.fileno())
+    return _stdin_reader.read(timeout)
+
+def _get_key_from_stdin() -> str:
+    # Pygame not initialized → fallback to terminal input
+    _read_stdin_keys(0)
+    k = _pop_key()
+    return k if k is not None else ""
+
+def _wait_key_from_stdin(timeout=None) -> str:
+    """Block until a key arrives on stdin or `timeout` seconds pass ("")."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    _read_stdin_keys(0)
+    while not _key_queue:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return ""
+        if sys.platform == "win32":
+            # no selectable console handle: poll at 10ms instead of blocking
+            time.sleep(0.01 if remaining is None else min(0.01, remaining))
+            _read_console_keys()
+        elif not _read_stdin_keys(remaining) and _stdin_reader.eof:
+            return ""
+    return _pop_key()
+
+def _wait_key_from_pygame(timeout=None) -> str:
+    """
+    Sleep in pygame.event.wait until a mapped key is pressed or `timeout`
+    seconds pass (""). Keys already pending are returned at once.
+    """
+    pg = _init_pygame()
+    keymap = _get_keymap()
+    poll_events()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not _key_queue and _last_key is None:
+        if deadline is None:
+            event = pg.event.wait()
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 return ""
-        finally:
-            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+            event = pg.event.wait(max(1, int(remaining * 1000)))
+        _handle_event(pg, keymap, event)
+    return _pop_key()
+
 def _get_key_from_pygame(blocking=False) -> str:
     """
     Returns the last pressed key as a string (e.g. 'up', 'a').
     If blocking=True, waits until a key is pressed.
     If blocking=False, returns None if no key was pressed.
     """
-    global _last_key
     if blocking:
-        # spin until key available
-        while True:
-            poll_events()
-            if _last_key is not None:
-                k = _last_key
-                _last_key = None
-                return k
-            time.sleep(0.005)
+        return _wait_key_from_pygame()
     else: # This is the TI Nspire way.
         poll_events()
-        if _last_key is not None:
-            k = _last_key
-            _last_key = None
+        k = _pop_key()
+        if k is not None:
             return k
         return "" # not None!
 
 def get_key() -> str:
+    if _profile is not None:
+        _profile_count("get_key")
     try:
         k = _get_key_from_pygame()
         # if k == "":  # pygame active but no window/no focus/no events
         #     return _get_key_from_stdin()
         # return k
         return k
-    except pygame.error as e:
+    except _init_pygame().error as e:
         if "video system not initialized" in str(e).lower():
             return _get_key_from_stdin()
         raise
+
+def wait_key(timeout=None) -> str:
+    """
+    Blocking get_key(): sleeps until a key is pressed and returns it, or
+    returns "" after `timeout` seconds. Not available on the calculator.
+    """
+    try:
+        return _wait_key_from_pygame(timeout)
+    except _init_pygame().error as e:
+        if "video system not initialized" in str(e).lower():
+            return _wait_key_from_stdin(timeout)
+        raise
+
+
+# ---- Key event queue (PC only) ----
+
+def _pump():
+    """poll_events(), or read the terminal when there is no video system."""
+    try:
+        poll_events()
+    except _init_pygame().error as e:
+        if "video system not initialized" not in str(e).lower():
+            raise
+        _read_stdin_keys(0)
+
+def drain_events() -> list:
+    """Return every queued KeyEvent (oldest first) and empty the queue."""
+    global _last_key
+    _pump()
+    events = list(_key_queue)
+    _key_queue.clear()
+    _last_key = None
+    return events
+
+def peek_event():
+    """The oldest queued KeyEvent without removing it, or None."""
+    _pump()
+    return _key_queue[0] if _key_queue else None
+
+def coalesce_events(keys=None) -> int:
+    """
+    Collapse runs of the same key (e.g. a held arrow) into their latest
+    event, only for `keys` if given. Returns the number of events removed.
+    """
+    _pump()
+    kept = []
+    for event in _key_queue:
+        if kept and kept[-1].key == event.key and (keys is None or event.key in keys):
+            kept[-1] = event
+        else:
+            kept.append(event)
+    removed = len(_key_queue) - len(kept)
+    _key_queue.clear()
+    _key_queue.extend(kept)
+    return removed
+
+def clear_events():
+    global _last_key
+    _key_queue.clear()
+    _last_key = None
+
+def set_event_queue_size(size: int):
+    """Resize the queue; when shrinking, the oldest events are dropped."""
+    global _key_queue
+    if size < 1:
+        raise ValueError("size must be at least 1")
+    _key_stats["dropped"] += max(0, len(_key_queue) - size)
+    _key_queue = deque(_key_queue, maxlen=size)
+
+def get_event_stats() -> dict:
+    """depth, capacity, pushed, dropped (overflowed) and max_depth."""
+    stats = dict(_key_stats)
+    stats["depth"] = len(_key_queue)
+    stats["capacity"] = _key_queue.maxlen
+    return stats
+
+def reset_event_stats():
+    for k in _key_stats:
+        _key_stats[k] = 0